@@ -1,14 +1,89 @@
 # securefile_core.py
+import io
 import os
+import sys
+import time
+import shutil
+import queue
+import argparse
+import functools
+import tempfile
+import threading
+import lzma
+import zlib
+import mmap
+import struct
+import hmac
+import json
+import hashlib
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import rsa, padding, x25519
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.backends import default_backend
-from cryptography.exceptions import InvalidKey
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidKey, InvalidTag
+
+import cipher_suites
+from cipher_suites import SUITE_AES_256_GCM
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 backend = default_backend()
 
+# Plaintext is processed in blocks of this size so memory use does not grow
+# with the file being encrypted.
+CHUNK_SIZE = 1024 * 1024
+
+# Version 2 container: a fixed header, a table of wrapped session keys and a
+# run of independently authenticated chunks. Every chunk except the last holds
+# exactly chunk_size bytes of plaintext, so chunk i always starts at
+# data_offset + i * frame_size and any byte range can be decrypted on its own.
+#
+#   header  magic | version | suite | flags | chunk_size | file_id | key_area_len
+#   keys    count, then per slot: kind | key fingerprint | length | wrapped key
+#   chunk   nonce | ciphertext | tag
+#
+# Each chunk is authenticated with the header fields, its index and a final
+# flag, so chunks cannot be reordered, moved between files or truncated away.
+#
+# A file split into volumes repeats the header in every volume with
+# FLAG_VOLUME set and a volume record (index, count, first chunk) after the
+# fixed fields. The record is part of the authenticated header and chunk
+# indices continue across volumes, so each volume verifies on its own and a
+# volume cannot be swapped, reordered or dropped from its set.
+MAGIC = b"FENC"
+FORMAT_VERSION = 2
+SLOT_RSA_OAEP = 1
+SLOT_X25519 = 2
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+# The low bits of the header flags name the codec the plaintext was
+# compressed with before chunking.
+COMPRESSION_MASK = 0x0F
+COMPRESS_NONE = 0
+COMPRESS_ZLIB = 1
+COMPRESS_LZMA = 2
+COMPRESS_ZSTD = 3
+COMPRESSION_CODECS = {"zlib": COMPRESS_ZLIB, "lzma": COMPRESS_LZMA, "zstd": COMPRESS_ZSTD}
+FLAG_VOLUME = 0x10
+# "auto" compresses this much of the input first and skips compression if it
+# saves less than COMPRESSION_MIN_SAVING (already-compressed media, archives).
+COMPRESSION_SAMPLE_SIZE = 256 * 1024
+COMPRESSION_MIN_SAVING = 0.1
+
+_HEADER = struct.Struct(">4sBBBI16sI")
+_SLOT = struct.Struct(">B32sH")
+_CHUNK_AAD = struct.Struct(">QB")
+_VOLUME = struct.Struct(">IIQ")
+
 def generate_rsa_keypair():
     private_key = rsa.generate_private_key(
         public_exponent=65537,
@@ -18,7 +93,98 @@ def generate_rsa_keypair():
     public_key = private_key.public_key()
     return private_key, public_key
 
-def save_rsa_keys(private_key, public_key, priv_path, pub_path):
+def _generate_rsa_pem(key_size):
+    # Runs in a worker process; keys cross the process boundary as PEM.
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=key_size, backend=backend)
+    return private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+
+def _keypair_from_pem(pem):
+    # The key was just generated by us, so the expensive RSA consistency check
+    # on load can be skipped.
+    private_key = serialization.load_pem_private_key(pem, password=None, backend=backend,
+                                                     unsafe_skip_rsa_key_validation=True)
+    return private_key, private_key.public_key()
+
+def generate_many(n, workers=None, key_size=4096):
+    with ProcessPoolExecutor(_resolve_workers(workers)) as pool:
+        return [_keypair_from_pem(pem) for pem in pool.map(_generate_rsa_pem, [key_size] * n)]
+
+
+class KeyPool:
+    """Keeps RSA keypairs generated ahead of time in background processes."""
+
+    def __init__(self, size=8, workers=None, key_size=4096):
+        self.size = size
+        self.key_size = key_size
+        self._executor = ProcessPoolExecutor(_resolve_workers(workers))
+        self._ready = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._error = None
+        self._closed = False
+        self._refill()
+
+    def _refill(self):
+        with self._lock:
+            while not self._closed and self._ready.qsize() + self._pending < self.size:
+                self._pending += 1
+                future = self._executor.submit(_generate_rsa_pem, self.key_size)
+                future.add_done_callback(self._generated)
+
+    def _generated(self, future):
+        with self._lock:
+            self._pending -= 1
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self._error = future.exception()
+            self._ready.put(None)
+            return
+        self._ready.put(future.result())
+        self._refill()
+
+    def available(self):
+        return self._ready.qsize()
+
+    def take(self, timeout=None):
+        # Returns immediately while keys are ready, otherwise waits for the next one.
+        pem = self._ready.get(timeout=timeout)
+        # Refilled before a failure is raised too, or every failed
+        # generation would leave the pool one key short for good.
+        self._refill()
+        if pem is None:
+            raise RuntimeError(f"Key generation failed: {self._error}")
+        return _keypair_from_pem(pem)
+
+    def generate_many(self, n):
+        keys = []
+        while len(keys) < n and self._ready.qsize():
+            keys.append(self.take(timeout=0))
+        pems = self._executor.map(_generate_rsa_pem, [self.key_size] * (n - len(keys)))
+        keys.extend(_keypair_from_pem(pem) for pem in pems)
+        return keys
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def generate_x25519_keypair():
+    private_key = x25519.X25519PrivateKey.generate()
+    return private_key, private_key.public_key()
+
+def save_keys(private_key, public_key, priv_path, pub_path):
     if not priv_path.endswith(".pem"):
         priv_path += "_private.pem"
     if not pub_path.endswith(".pem"):
@@ -36,68 +202,2097 @@ def save_rsa_keys(private_key, public_key, priv_path, pub_path):
             format=serialization.PublicFormat.SubjectPublicKeyInfo
         ))
 
-def load_public_key(path):
-    with open(path, 'rb') as f:
-        return serialization.load_pem_public_key(f.read(), backend=backend)
+# PEM files are self-describing, so the same helpers save and load RSA and
+# X25519 keys alike.
+save_rsa_keys = save_keys
+save_x25519_keys = save_keys
+
+# Parsed keys, keyed by the file's identity and modification time so an edited
+# or replaced key file is re-read. Least recently used entries are evicted.
+KEY_CACHE_SIZE = 32
+_key_cache = OrderedDict()
+_key_cache_lock = threading.Lock()
+
+def _load_cached_key(path, kind, parse):
+    real_path = os.path.realpath(path)
+    st = os.stat(real_path)
+    cache_key = (kind, real_path, st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+    with _key_cache_lock:
+        key = _key_cache.get(cache_key)
+        if key is not None:
+            _key_cache.move_to_end(cache_key)
+            return key
+
+    with open(real_path, 'rb') as f:
+        key = parse(f.read())
+
+    with _key_cache_lock:
+        for stale in [k for k in _key_cache if k[:2] == (kind, real_path)]:
+            del _key_cache[stale]
+        _key_cache[cache_key] = key
+        while len(_key_cache) > KEY_CACHE_SIZE:
+            _key_cache.popitem(last=False)
+    return key
+
+def invalidate_key_cache(path=None):
+    with _key_cache_lock:
+        if path is None:
+            _key_cache.clear()
+            return
+        real_path = os.path.realpath(path)
+        for stale in [k for k in _key_cache if k[1] == real_path]:
+            del _key_cache[stale]
 
-def load_private_key(path):
+def _parse_public_key(data):
+    return serialization.load_pem_public_key(data, backend=backend)
+
+def _parse_private_key(data):
+    return serialization.load_pem_private_key(data, password=None, backend=backend)
+
+def load_public_key(path, cache=True):
+    if cache:
+        return _load_cached_key(path, "public", _parse_public_key)
     with open(path, 'rb') as f:
-        return serialization.load_pem_private_key(f.read(), password=None, backend=backend)
+        return _parse_public_key(f.read())
 
-def encrypt_file_rsa(file_path, public_key):
-    aes_key = os.urandom(32)
-    iv = os.urandom(16)
+def load_private_key(path, cache=True):
+    if cache:
+        return _load_cached_key(path, "private", _parse_private_key)
+    with open(path, 'rb') as f:
+        return _parse_private_key(f.read())
 
-    with open(file_path, 'rb') as f:
-        data = f.read()
+def key_fingerprint(public_key):
+    der = public_key.public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return hashlib.sha256(der).digest()
 
-    cipher = Cipher(algorithms.AES(aes_key), modes.CFB(iv), backend=backend)
-    encryptor = cipher.encryptor()
-    encrypted_data = encryptor.update(data) + encryptor.finalize()
-
-    encrypted_key = public_key.encrypt(
-        aes_key,
-        padding.OAEP(
-            mgf=padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None
-        )
+def _oaep():
+    return padding.OAEP(
+        mgf=padding.MGF1(algorithm=hashes.SHA256()),
+        algorithm=hashes.SHA256(),
+        label=None
     )
 
+def read_full(f, size):
+    # Pipes and sockets may return short reads; chunk framing needs whole blocks.
+    buf = f.read(size)
+    if buf is None or len(buf) == size or not buf:
+        return buf or b""
+    parts = [buf]
+    remaining = size - len(buf)
+    while remaining:
+        more = f.read(remaining)
+        if not more:
+            break
+        parts.append(more)
+        remaining -= len(more)
+    return b"".join(parts)
+
+
+class FileHeader:
+    def __init__(self, suite, flags, chunk_size, file_id, slots, key_area_len=None, volume=None):
+        self.suite = suite
+        self.flags = flags | FLAG_VOLUME if volume is not None else flags
+        self.chunk_size = chunk_size
+        self.file_id = file_id
+        self.slots = slots  # list of (kind, fingerprint, wrapped_key)
+        self.key_area_len = key_area_len if key_area_len is not None else len(self.pack_key_area())
+        self.volume = volume  # (index, count, first_chunk) for one volume of a set
+
+    @property
+    def compression(self):
+        return self.flags & COMPRESSION_MASK
+
+    @property
+    def frame_size(self):
+        return NONCE_SIZE + self.chunk_size + TAG_SIZE
+
+    @property
+    def first_chunk(self):
+        return self.volume[2] if self.volume is not None else 0
+
+    @property
+    def volume_bytes(self):
+        return _VOLUME.pack(*self.volume) if self.volume is not None else b""
+
+    @property
+    def data_offset(self):
+        return _HEADER.size + len(self.volume_bytes) + self.key_area_len
+
+    @property
+    def fixed_bytes(self):
+        # Everything but the key table, which rewrapping is allowed to change.
+        return _HEADER.pack(MAGIC, FORMAT_VERSION, self.suite, self.flags,
+                            self.chunk_size, self.file_id, 0)[:-4] + self.volume_bytes
+
+    def pack_key_area(self):
+        parts = [struct.pack(">H", len(self.slots))]
+        for kind, fingerprint, wrapped in self.slots:
+            parts.append(_SLOT.pack(kind, fingerprint, len(wrapped)))
+            parts.append(wrapped)
+        return b"".join(parts)
+
+    def pack(self):
+        key_area = self.pack_key_area()
+        if len(key_area) > self.key_area_len:
+            raise ValueError("Key table does not fit in the reserved header space")
+        key_area = key_area.ljust(self.key_area_len, b"\0")
+        return (_HEADER.pack(MAGIC, FORMAT_VERSION, self.suite, self.flags, self.chunk_size,
+                             self.file_id, self.key_area_len) + self.volume_bytes + key_area)
+
+    def chunk_aad(self, index, final):
+        # index counts from the start of this file or volume.
+        return self.fixed_bytes + _CHUNK_AAD.pack(self.first_chunk + index, 1 if final else 0)
+
+    def find_slot(self, public_key):
+        # Only fingerprints are compared; the one matching slot is unwrapped.
+        fingerprint = key_fingerprint(public_key)
+        for slot in self.slots:
+            if slot[1] == fingerprint:
+                return slot
+        raise ValueError("File was not encrypted for this key")
+
+
+def _payload_layout(header, stored):
+    # Returns (chunk count, plaintext size) for `stored` bytes of frames.
+    frame_size = header.frame_size
+    chunks = max(1, -(-stored // frame_size))
+    last = stored - (chunks - 1) * frame_size
+    return chunks, (chunks - 1) * header.chunk_size + max(0, last - NONCE_SIZE - TAG_SIZE)
+
+def is_chunked_file(f):
+    pos = f.tell()
+    magic = f.read(len(MAGIC))
+    f.seek(pos)
+    return magic == MAGIC
+
+def read_header(f):
+    raw = read_full(f, _HEADER.size)
+    if len(raw) != _HEADER.size:
+        raise ValueError("Truncated file header")
+    magic, version, suite, flags, chunk_size, file_id, key_area_len = _HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ValueError("Not a chunked encrypted file")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported format version {version}")
+    if suite not in cipher_suites.SUITES:
+        raise ValueError(f"Unknown cipher suite {suite}")
+    volume = None
+    if flags & FLAG_VOLUME:
+        raw = read_full(f, _VOLUME.size)
+        if len(raw) != _VOLUME.size:
+            raise ValueError("Truncated file header")
+        volume = _VOLUME.unpack(raw)
+    key_area = read_full(f, key_area_len)
+    if len(key_area) != key_area_len:
+        raise ValueError("Truncated key table")
+    (count,) = struct.unpack_from(">H", key_area)
+    slots = []
+    pos = 2
+    for _ in range(count):
+        kind, fingerprint, length = _SLOT.unpack_from(key_area, pos)
+        pos += _SLOT.size
+        slots.append((kind, fingerprint, key_area[pos:pos + length]))
+        pos += length
+    return FileHeader(suite, flags, chunk_size, file_id, slots, key_area_len, volume)
+
+def _as_key_list(public_keys):
+    if isinstance(public_keys, (list, tuple)):
+        return list(public_keys)
+    return [public_keys]
+
+def _x25519_kek(shared, ephemeral_public, recipient_public):
+    salt = (ephemeral_public.public_bytes_raw() + recipient_public.public_bytes_raw())
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt,
+                info=b"FileEnc X25519 key wrap").derive(shared)
+
+def _wrap_session_key(public_key, session_key):
+    # Returns a key slot. X25519 slots hold an ephemeral public key and the
+    # session key sealed under a key derived from the ECDH shared secret; the
+    # derived key is used exactly once, so a fixed nonce is safe.
+    fingerprint = key_fingerprint(public_key)
+    if isinstance(public_key, x25519.X25519PublicKey):
+        ephemeral = x25519.X25519PrivateKey.generate()
+        ephemeral_public = ephemeral.public_key()
+        kek = _x25519_kek(ephemeral.exchange(public_key), ephemeral_public, public_key)
+        sealed = AESGCM(kek).encrypt(b"\0" * NONCE_SIZE, session_key, fingerprint)
+        return SLOT_X25519, fingerprint, ephemeral_public.public_bytes_raw() + sealed
+    if isinstance(public_key, rsa.RSAPublicKey):
+        return SLOT_RSA_OAEP, fingerprint, public_key.encrypt(session_key, _oaep())
+    raise ValueError("Unsupported public key type")
+
+def _new_header(public_keys, chunk_size, flags=0, suite=None):
+    # The payload is encrypted once; each recipient gets its own wrapped copy
+    # of the session key.
+    session_key = AESGCM.generate_key(bit_length=256)
+    slots = []
+    seen = set()
+    for public_key in _as_key_list(public_keys):
+        fingerprint = key_fingerprint(public_key)
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        slots.append(_wrap_session_key(public_key, session_key))
+    if not slots:
+        raise ValueError("At least one recipient public key is required")
+    header = FileHeader(suite or cipher_suites.preferred_suite(), flags, chunk_size, os.urandom(16), slots)
+    return header, session_key
+
+def _unwrap_session_key(header, private_key):
+    kind, fingerprint, wrapped = header.find_slot(private_key.public_key())
+    if kind == SLOT_X25519 and isinstance(private_key, x25519.X25519PrivateKey):
+        ephemeral_public = x25519.X25519PublicKey.from_public_bytes(wrapped[:32])
+        kek = _x25519_kek(private_key.exchange(ephemeral_public), ephemeral_public,
+                          private_key.public_key())
+        try:
+            return AESGCM(kek).decrypt(b"\0" * NONCE_SIZE, wrapped[32:], fingerprint)
+        except InvalidTag:
+            raise ValueError("Invalid X25519 key or file format")
+    if kind == SLOT_RSA_OAEP and isinstance(private_key, rsa.RSAPrivateKey):
+        try:
+            return private_key.decrypt(wrapped, _oaep())
+        except (InvalidKey, ValueError):
+            raise ValueError("Invalid RSA key or file format")
+    raise ValueError("Unsupported key slot type")
+
+def write_key_container(path, public_keys):
+    # A header with no payload: a fresh random key wrapped for each recipient,
+    # which rewrap can rotate like any encrypted file. Returns the key. The
+    # suite is fixed as there is no payload, so no benchmark runs.
+    header, key = _new_header(public_keys, 0, suite=SUITE_AES_256_GCM)
+    with open(path, 'wb') as f:
+        f.write(header.pack())
+    return key
+
+def read_key_container(path, private_key):
+    with open(path, 'rb') as f:
+        header = read_header(f)
+    if header.chunk_size != 0:
+        raise ValueError(f"{path} is an encrypted file, not a key container")
+    return _unwrap_session_key(header, private_key)
+
+class _ChunkCipher:
+    def __init__(self, header, session_key):
+        self.header = header
+        self.aead = cipher_suites.aead(header.suite, session_key)
+
+    def encrypt(self, index, final, block):
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self.aead.encrypt(nonce, block, self.header.chunk_aad(index, final))
+
+    def decrypt(self, index, final, frame):
+        try:
+            return self.aead.decrypt(frame[:NONCE_SIZE], frame[NONCE_SIZE:],
+                                     self.header.chunk_aad(index, final))
+        except InvalidTag:
+            raise ValueError(f"Chunk {index} failed authentication")
+
+
+def _plain_chunks(src, chunk_size):
+    # Yields (index, final, block); reads one block ahead to find the last one.
+    index = 0
+    block = read_full(src, chunk_size)
+    while True:
+        following = read_full(src, chunk_size) if len(block) == chunk_size else b""
+        final = not following
+        yield index, final, block
+        if final:
+            return
+        block = following
+        index += 1
+
+def _cipher_frames(src, header):
+    index = 0
+    frame = read_full(src, header.frame_size)
+    while True:
+        if len(frame) < NONCE_SIZE + TAG_SIZE:
+            raise ValueError("Encrypted file is truncated")
+        following = read_full(src, header.frame_size) if len(frame) == header.frame_size else b""
+        final = not following
+        yield index, final, frame
+        if final:
+            return
+        frame = following
+        index += 1
+
+
+_worker_cipher = None
+
+def _init_chunk_worker(header, session_key):
+    global _worker_cipher
+    _worker_cipher = _ChunkCipher(header, session_key)
+
+def _encrypt_job(cipher, job):
+    return cipher.encrypt(*job)
+
+def _decrypt_job(cipher, job):
+    return cipher.decrypt(*job)
+
+def _pool_job(func, job):
+    return func(_worker_cipher, job)
+
+def _resolve_workers(workers):
+    return max(1, workers if workers else (os.cpu_count() or 1))
+
+def _chunk_pool(header, session_key, workers):
+    return ProcessPoolExecutor(workers, initializer=_init_chunk_worker,
+                               initargs=(header, session_key))
+
+def _map_chunks(func, jobs, header, session_key, workers=1, pool=None):
+    # Applies func to every chunk, yielding results in chunk order. With more
+    # than one worker the chunks are spread over a process pool; at most two
+    # chunks per worker are in flight, so the queue of pending futures doubles
+    # as a bounded reorder buffer and memory stays flat for any file size.
+    workers = _resolve_workers(workers)
+    if workers == 1:
+        cipher = _ChunkCipher(header, session_key)
+        for job in jobs:
+            yield func(cipher, job)
+        return
+
+    own_pool = pool is None
+    if own_pool:
+        pool = _chunk_pool(header, session_key, workers)
+    try:
+        pending = deque()
+        for job in jobs:
+            pending.append(pool.submit(_pool_job, func, job))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        if own_pool:
+            pool.shutdown(cancel_futures=True)
+
+# Between files on disk every chunk has a fixed place: plaintext chunk i
+# starts at i * chunk_size and its frame at data_offset + i * frame_size. So
+# with several workers each one opens the files itself and reads and writes
+# its own run of chunks, as _write_volume does, and only a status comes back
+# through the pool instead of every block being pickled both ways.
+
+_RANGE_CHUNKS = 8
+
+
+class _RangeWorker:
+    def __init__(self, header, session_key, src_path, dst_path, chunks, size=None, out_offset=0,
+                 manifest_key=None):
+        self.header = header
+        self.cipher = _ChunkCipher(header, session_key)
+        self.chunks = chunks
+        self.size = size
+        self.out_offset = out_offset
+        self.manifest_key = manifest_key
+        self.src = open(src_path, 'rb')
+        self.dst = open(dst_path, 'r+b') if dst_path else None
+        # Blocks are read into one reused buffer: in a fresh process every
+        # new chunk-sized bytes object is mapped and faulted in page by page.
+        self.buffer = memoryview(bytearray(header.frame_size))
+
+    def _read(self, pos, size):
+        self.src.seek(pos)
+        done = 0
+        while done < size:
+            count = self.src.readinto(self.buffer[done:size])
+            if not count:
+                break
+            done += count
+        return self.buffer[:done]
+
+    def encrypt(self, first, count):
+        # Returns the manifest digests of the chunks, or None.
+        header = self.header
+        digests = [] if self.manifest_key is not None else None
+        for index in range(first, first + count):
+            final = index == self.chunks - 1
+            block = self._read(index * header.chunk_size, header.chunk_size)
+            if len(block) != (self.size - index * header.chunk_size if final else header.chunk_size):
+                raise ValueError("File changed size while it was being encrypted")
+            # The nonce is written on its own to save a copy of the frame.
+            nonce = os.urandom(NONCE_SIZE)
+            self.dst.seek(header.data_offset + index * header.frame_size)
+            self.dst.write(nonce)
+            self.dst.write(self.cipher.aead.encrypt(nonce, block, header.chunk_aad(index, final)))
+            if digests is not None:
+                digests.append(_chunk_digest(self.manifest_key, block))
+        self.dst.flush()
+        return digests
+
+    def decrypt(self, first, count):
+        header = self.header
+        for index in range(first, first + count):
+            frame = self._read(header.data_offset + index * header.frame_size, header.frame_size)
+            if len(frame) < NONCE_SIZE + TAG_SIZE:
+                raise ValueError("Encrypted file is truncated")
+            self.dst.seek(self.out_offset + index * header.chunk_size)
+            self.dst.write(self.cipher.decrypt(index, index == self.chunks - 1, frame))
+        self.dst.flush()
+
+    def verify(self, first, count):
+        # Returns the indexes of the chunks that failed authentication.
+        header = self.header
+        bad = []
+        for index in range(first, first + count):
+            frame = self._read(header.data_offset + index * header.frame_size, header.frame_size)
+            try:
+                self.cipher.decrypt(index, index == self.chunks - 1, frame)
+            except ValueError:
+                bad.append(index)
+        return bad
+
+
+_range_worker = None
+
+def _init_range_worker(*args):
+    global _range_worker
+    _range_worker = _RangeWorker(*args)
+
+def _range_job(func, first, count):
+    return func(_range_worker, first, count)
+
+def _run_ranges(func, chunks, workers, args, tracker=None, unit=0, total=0):
+    # Runs func over runs of _RANGE_CHUNKS chunks and returns the results in
+    # chunk order. Progress advances by `unit` input bytes per chunk, capped
+    # at `total`, as each run completes.
+    ranges = [(first, min(_RANGE_CHUNKS, chunks - first)) for first in range(0, chunks, _RANGE_CHUNKS)]
+    pool = ProcessPoolExecutor(min(workers, len(ranges)), initializer=_init_range_worker,
+                               initargs=args)
+    try:
+        futures = [pool.submit(_range_job, func, first, count) for first, count in ranges]
+        results = []
+        for future, (first, count) in zip(futures, ranges):
+            results.append(future.result())
+            if tracker is not None:
+                tracker.advance(min(total, (first + count) * unit) - first * unit)
+        return results
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+def _uses_ranges(workers, compression=None, io_mode="buffered"):
+    return (io_mode != "mmap" and _resolve_workers(workers) > 1
+            and (not compression or compression == "none"))
+
+def _encrypt_ranges(file_path, output_path, public_keys, chunk_size, workers, digests=None,
+                    suite=None, tracker=None):
+    size = os.path.getsize(file_path)
+    header, session_key = _new_header(public_keys, chunk_size, suite=suite)
+    chunks = max(1, -(-size // chunk_size))
+    with open(output_path, 'wb') as dst:
+        dst.write(header.pack())
+        dst.truncate(header.data_offset + size + chunks * (NONCE_SIZE + TAG_SIZE))
+    manifest_key = _manifest_key(session_key) if digests is not None else None
+    args = (header, session_key, file_path, output_path, chunks, size, 0, manifest_key)
+    for result in _run_ranges(_RangeWorker.encrypt, chunks, _resolve_workers(workers), args,
+                              tracker, chunk_size, size):
+        if digests is not None:
+            digests.extend(result)
+    return header
+
+def _decrypt_ranges(file_path, output_path, header, session_key, workers, tracker=None,
+                    out_offset=0):
+    # output_path must already exist; the plaintext lands at out_offset.
+    stored = os.path.getsize(file_path) - header.data_offset
+    chunks, _ = _payload_layout(header, stored)
+    args = (header, session_key, file_path, output_path, chunks, None, out_offset)
+    _run_ranges(_RangeWorker.decrypt, chunks, _resolve_workers(workers), args,
+                tracker, header.frame_size, stored)
+
+def _compressor(codec):
+    if codec == COMPRESS_ZLIB:
+        return zlib.compressobj(6)
+    if codec == COMPRESS_LZMA:
+        return lzma.LZMACompressor()
+    if codec == COMPRESS_ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor().compressobj()
+    raise ValueError(f"Unsupported compression codec {codec}")
+
+def _decompressor(codec):
+    if codec == COMPRESS_ZLIB:
+        return zlib.decompressobj()
+    if codec == COMPRESS_LZMA:
+        return lzma.LZMADecompressor()
+    if codec == COMPRESS_ZSTD and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Unsupported compression codec {codec}")
+
+
+class _PrefixedReader:
+    # Puts bytes already consumed (a compression sample) back in front of src.
+    def __init__(self, prefix, src):
+        self._prefix = prefix
+        self._src = src
+
+    def read(self, size=-1):
+        if not self._prefix:
+            return self._src.read(size)
+        if size is None or size < 0:
+            data, self._prefix = self._prefix + self._src.read(), b""
+            return data
+        data, self._prefix = self._prefix[:size], self._prefix[size:]
+        return data
+
+
+class _CompressingReader:
+    def __init__(self, src, codec):
+        self._src = src
+        self._compressor = _compressor(codec)
+        self._buffer = bytearray()
+        self._eof = False
+
+    def read(self, size=-1):
+        while not self._eof and (size is None or size < 0 or len(self._buffer) < size):
+            data = self._src.read(CHUNK_SIZE)
+            if data:
+                self._buffer += self._compressor.compress(data)
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class _DecompressingWriter:
+    def __init__(self, dst, codec):
+        self._dst = dst
+        self._codec = codec
+        self._decompressor = _decompressor(codec)
+
+    def write(self, data):
+        if self._codec == COMPRESS_ZSTD:
+            self._dst.write(self._decompressor.decompress(data))
+            return
+        # Bound each step's output so a tiny chunk cannot expand without limit.
+        while True:
+            self._dst.write(self._decompressor.decompress(data, CHUNK_SIZE))
+            if self._codec == COMPRESS_ZLIB:
+                data = self._decompressor.unconsumed_tail
+                if not data:
+                    return
+            else:
+                data = b""
+                if self._decompressor.needs_input or self._decompressor.eof:
+                    return
+
+    def finish(self):
+        if self._codec == COMPRESS_ZLIB:
+            self._dst.write(self._decompressor.flush())
+        if self._codec != COMPRESS_ZSTD and not self._decompressor.eof:
+            raise ValueError("Compressed stream is incomplete")
+
+
+def _compression_stage(src, compression):
+    # Returns (codec, reader) for the requested compression setting.
+    if not compression or compression == "none":
+        return COMPRESS_NONE, src
+    if compression == "auto":
+        sample = read_full(src, COMPRESSION_SAMPLE_SIZE)
+        src = _PrefixedReader(sample, src)
+        if not sample:
+            return COMPRESS_NONE, src
+        if len(zlib.compress(sample, 1)) > len(sample) * (1 - COMPRESSION_MIN_SAVING):
+            return COMPRESS_NONE, src
+        compression = "zstd" if zstandard is not None else "zlib"
+    codec = COMPRESSION_CODECS.get(compression)
+    if codec is None:
+        raise ValueError(f"Unknown compression '{compression}'")
+    if codec == COMPRESS_ZSTD and zstandard is None:
+        raise ValueError("zstd compression needs the 'zstandard' package")
+    return codec, _CompressingReader(src, codec)
+
+# --- Progress and cancellation ---
+#
+# Long operations take progress(done, total), called with the input bytes
+# consumed so far (total is None for streams of unknown length), and a
+# CancelToken that is checked before every chunk. File operations write to a
+# temporary sibling that replaces the output only on success, so a cancelled
+# or failed run leaves any earlier output in place.
+
+class OperationCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    # cancel() may be called from any thread, e.g. a UI button handler.
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise OperationCancelled("Operation cancelled")
+
+
+class _Progress:
+    def __init__(self, total, callback=None, cancel=None):
+        self.total = total
+        self.done = 0
+        self._callback = callback
+        self._cancel = cancel
+
+    def advance(self, count):
+        if self._cancel is not None:
+            self._cancel.check()
+        self.done += count
+        if self._callback is not None:
+            self._callback(self.done, self.total)
+
+
+class _ProgressReader:
+    def __init__(self, src, tracker):
+        self._src = src
+        self._tracker = tracker
+
+    def read(self, size=-1):
+        self._tracker.advance(0)
+        data = self._src.read(size)
+        self._tracker.advance(len(data))
+        return data
+
+
+class _HashingReader:
+    def __init__(self, src, content_hash):
+        self._src = src
+        self._hash = content_hash
+
+    def read(self, size=-1):
+        data = self._src.read(size)
+        self._hash.update(data)
+        return data
+
+
+def _tracker(total, progress, cancel):
+    return _Progress(total, progress, cancel) if progress or cancel else None
+
+def _tracked(src, tracker):
+    return _ProgressReader(src, tracker) if tracker is not None else src
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _temp_sibling(path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".part")
+    os.close(fd)
+    return tmp_path
+
+def _install(tmp_path, path, like=None):
+    # Moves a finished temporary file into place, keeping the mode of the
+    # file it replaces, or else of `like`.
+    try:
+        for source in (path, like):
+            if source is not None and os.path.exists(source):
+                shutil.copymode(source, tmp_path)
+                break
+        os.replace(tmp_path, path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+
+
+class _replacing:
+    # with _replacing(path, like) as tmp_path: write tmp_path; it becomes
+    # path when the block succeeds and is removed otherwise.
+    def __init__(self, path, like=None):
+        self.path = path
+        self.like = like
+
+    def __enter__(self):
+        self.tmp_path = _temp_sibling(self.path)
+        return self.tmp_path
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            _install(self.tmp_path, self.path, self.like)
+        else:
+            _discard(self.tmp_path)
+
+# --- Overlapped I/O ---
+#
+# In "pipelined" mode a reader thread and a writer thread run alongside the
+# cipher stage, connected by queues of PIPELINE_DEPTH chunks. File reads and
+# writes release the GIL, so I/O waits overlap with encryption and
+# throughput approaches the slower of disk and cipher instead of the sum of
+# their times.
+
+IO_MODES = ("buffered", "pipelined", "mmap")
+PIPELINE_DEPTH = 4
+_END = object()
+
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+
+class _Stage(threading.Thread):
+    def __init__(self, depth):
+        super().__init__(daemon=True)
+        self.queue = queue.Queue(depth)
+        self.stopped = threading.Event()
+
+    def put(self, item):
+        # Gives up once the stage is stopped so an aborted run never blocks.
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def stop(self):
+        self.stopped.set()
+
+
+class _ReaderStage(_Stage):
+    def __init__(self, jobs, depth=PIPELINE_DEPTH):
+        super().__init__(depth)
+        self._jobs = jobs
+
+    def run(self):
+        try:
+            for job in self._jobs:
+                if not self.put(job):
+                    return
+            self.put(_END)
+        except BaseException as e:
+            self.put(_StageError(e))
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is _END:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+
+
+class _WriterStage(_Stage):
+    def __init__(self, dst, depth=PIPELINE_DEPTH):
+        super().__init__(depth)
+        self._dst = dst
+        self.error = None
+
+    def run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.stopped.is_set():
+                    return
+                continue
+            if item is _END:
+                return
+            try:
+                self._dst.write(item)
+            except BaseException as e:
+                self.error = e
+                self.stop()
+                return
+
+    def write(self, data):
+        if not self.put(data) and self.error is not None:
+            raise self.error
+
+    def finish(self):
+        self.put(_END)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+class _pipelined:
+    # with _pipelined(jobs, dst) as (jobs, out): reads and writes on threads.
+    def __init__(self, jobs, dst):
+        self.reader = _ReaderStage(jobs)
+        self.writer = _WriterStage(dst)
+
+    def __enter__(self):
+        self.reader.start()
+        self.writer.start()
+        return self.reader, self.writer
+
+    def __exit__(self, exc_type, exc, tb):
+        self.reader.stop()
+        if exc_type is None:
+            self.writer.finish()
+        else:
+            self.writer.stop()
+            self.writer.join()
+
+def _check_io_mode(io_mode):
+    if io_mode not in IO_MODES:
+        raise ValueError(f"Unknown io_mode '{io_mode}'")
+
+def _run_chunks(func, jobs, dst, header, session_key, workers, io_mode, finish=None):
+    if io_mode != "pipelined":
+        _drain(func, jobs, dst, header, session_key, workers, None, finish)
+        return
+    pool = None
+    workers = _resolve_workers(workers)
+    if workers > 1:
+        # Start the worker processes before the pipeline threads exist, so no
+        # child is forked while a thread holds a lock.
+        pool = _chunk_pool(header, session_key, workers)
+        pool.submit(int).result()
+    try:
+        with _pipelined(jobs, dst) as (jobs, out):
+            _drain(func, jobs, out, header, session_key, workers, pool, finish)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+def _drain(func, jobs, out, header, session_key, workers, pool, finish):
+    if finish is not None:
+        out = finish(out)
+    for result in _map_chunks(func, jobs, header, session_key, workers, pool):
+        out.write(result)
+    if finish is not None:
+        out.finish()
+
+def _encrypt_chunks(src, dst, header, session_key, workers=1, io_mode="buffered"):
+    jobs = _plain_chunks(src, header.chunk_size)
+    _run_chunks(_encrypt_job, jobs, dst, header, session_key, workers, io_mode)
+
+def _decrypt_chunks(src, dst, header, session_key, workers=1, io_mode="buffered"):
+    finish = None
+    if header.compression:
+        finish = lambda out: _DecompressingWriter(out, header.compression)
+    jobs = _cipher_frames(src, header)
+    _run_chunks(_decrypt_job, jobs, dst, header, session_key, workers, io_mode, finish)
+
+def _copy_through(ctx, src, dst, chunk_size):
+    # Feed fixed-size blocks through a cipher context so memory stays flat.
+    while True:
+        block = src.read(chunk_size)
+        if not block:
+            break
+        dst.write(ctx.update(block))
+    dst.write(ctx.finalize())
+
+# --- Memory-mapped I/O ---
+#
+# io_mode="mmap" maps the input and a preallocated output file and has
+# AES-GCM read from and write into the mappings through memoryview slices,
+# so no per-chunk bytes objects are created or copied. It works on local
+# files only, runs in the calling process and does not combine with
+# compression, which changes the output size. update_into exists for AES-GCM
+# only, so mmap always encrypts with that suite and other suites are
+# decrypted through the buffered path.
+
+def _gcm_encrypt_into(key, nonce, aad, block, out):
+    # out must leave room for len(block) + 15 bytes; the tag is returned.
+    encryptor = Cipher(algorithms.AES(key), modes.GCM(nonce), backend=backend).encryptor()
+    encryptor.authenticate_additional_data(aad)
+    encryptor.update_into(block, out)
+    encryptor.finalize()
+    return encryptor.tag
+
+def _gcm_decrypt_into(key, nonce, tag, aad, frame, out, index):
+    decryptor = Cipher(algorithms.AES(key), modes.GCM(nonce, tag), backend=backend).decryptor()
+    decryptor.authenticate_additional_data(aad)
+    decryptor.update_into(frame, out)
+    try:
+        decryptor.finalize()
+    except InvalidTag:
+        raise ValueError(f"Chunk {index} failed authentication")
+
+def _check_mmap_options(workers, compression=None, suite=None):
+    if _resolve_workers(workers) != 1:
+        raise ValueError("io_mode='mmap' runs in the calling process; use workers=1")
+    if compression:
+        raise ValueError("io_mode='mmap' cannot be combined with compression")
+    if suite not in (None, SUITE_AES_256_GCM):
+        raise ValueError("io_mode='mmap' writes AES-256-GCM files only")
+
+def _encrypt_mmap(src, dst, header, session_key, digests=None, tracker=None, content_hash=None):
+    size = os.fstat(src.fileno()).st_size
+    chunk_size = header.chunk_size
+    chunks = max(1, -(-size // chunk_size))
+    total = header.data_offset + size + chunks * (NONCE_SIZE + TAG_SIZE)
+    dst.truncate(total)
+    manifest_key = _manifest_key(session_key) if digests is not None else None
+
+    in_map = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+    out_map = mmap.mmap(dst.fileno(), total)
+    src_view = memoryview(in_map) if in_map is not None else memoryview(b"")
+    out_view = memoryview(out_map)
+    try:
+        for index in range(chunks):
+            if tracker is not None:
+                tracker.advance(0)
+            pos = header.data_offset + index * header.frame_size
+            nonce = os.urandom(NONCE_SIZE)
+            out_view[pos:pos + NONCE_SIZE] = nonce
+            pos += NONCE_SIZE
+            aad = header.chunk_aad(index, index == chunks - 1)
+            with src_view[index * chunk_size:(index + 1) * chunk_size] as block:
+                length = len(block)
+                # The 15 spare bytes update_into asks for fall on the tag,
+                # which is written afterwards.
+                with out_view[pos:pos + length + 15] as target:
+                    tag = _gcm_encrypt_into(session_key, nonce, aad, block, target)
+                if manifest_key is not None:
+                    digests.append(_chunk_digest(manifest_key, block))
+                if content_hash is not None:
+                    content_hash.update(block)
+            out_view[pos + length:pos + length + TAG_SIZE] = tag
+            if tracker is not None:
+                tracker.advance(length)
+    finally:
+        src_view.release()
+        out_view.release()
+        out_map.close()
+        if in_map is not None:
+            in_map.close()
+
+def _decrypt_mmap(src, dst, header, session_key, tracker=None):
+    if header.compression:
+        raise ValueError("io_mode='mmap' cannot be used for compressed files")
+    file_size = os.fstat(src.fileno()).st_size
+    chunks, size = _payload_layout(header, file_size - header.data_offset)
+    # Room for the 15 spare bytes update_into wants after the last chunk.
+    dst.truncate(size + 15)
+
+    in_map = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+    out_map = mmap.mmap(dst.fileno(), size + 15)
+    in_view = memoryview(in_map)
+    out_view = memoryview(out_map)
+    try:
+        for index in range(chunks):
+            pos = header.data_offset + index * header.frame_size
+            length = min(header.frame_size, file_size - pos) - NONCE_SIZE - TAG_SIZE
+            if length < 0:
+                raise ValueError("Encrypted file is truncated")
+            nonce = in_map[pos:pos + NONCE_SIZE]
+            pos += NONCE_SIZE
+            tag = in_map[pos + length:pos + length + TAG_SIZE]
+            aad = header.chunk_aad(index, index == chunks - 1)
+            start = index * header.chunk_size
+            with in_view[pos:pos + length] as frame, out_view[start:start + length + 15] as target:
+                _gcm_decrypt_into(session_key, nonce, tag, aad, frame, target, index)
+            if tracker is not None:
+                tracker.advance(length + NONCE_SIZE + TAG_SIZE)
+    finally:
+        in_view.release()
+        out_view.release()
+        out_map.close()
+        in_map.close()
+    dst.truncate(size)
+
+def _encrypt_stream(src, dst, public_keys, chunk_size, workers, compression, io_mode, digests=None,
+                    suite=None):
+    codec, src = _compression_stage(src, compression)
+    header, session_key = _new_header(public_keys, chunk_size, codec, suite)
+    dst.write(header.pack())
+    if digests is not None:
+        src = _DigestingReader(src, _manifest_key(session_key), chunk_size, digests)
+    _encrypt_chunks(src, dst, header, session_key, workers, io_mode)
+    return header
+
+def _check_chunk_size(chunk_size):
+    # The header stores the size in 32 bits; 0 would encrypt nothing.
+    if not 0 < chunk_size < 1 << 32:
+        raise ValueError("Chunk size must be at least 1 byte and below 4 GiB")
+
+def _check_stream_io_mode(io_mode):
+    _check_io_mode(io_mode)
+    if io_mode == "mmap":
+        raise ValueError("io_mode 'mmap' needs real files, not streams")
+
+def encrypt_stream(src, dst, public_keys, chunk_size=CHUNK_SIZE, workers=1, compression=None,
+                   io_mode="buffered", suite=None, progress=None, cancel=None):
+    # src and dst are any binary file objects (pipes, sockets, stdin/stdout);
+    # they are only read and written sequentially, one chunk at a time.
+    _check_stream_io_mode(io_mode)
+    _check_chunk_size(chunk_size)
+    src = _tracked(src, _tracker(None, progress, cancel))
+    _encrypt_stream(src, dst, public_keys, chunk_size, workers, compression, io_mode, suite=suite)
+
+def encrypt_file_rsa(file_path, public_keys, chunk_size=CHUNK_SIZE, workers=1, compression=None,
+                     manifest=False, io_mode="buffered", suite=None, progress=None, cancel=None,
+                     content_hash=None):
+    # content_hash, a hashlib object, is fed the plaintext as it is read, so
+    # callers that need a digest of the file do not read it a second time.
+    _check_io_mode(io_mode)
+    _check_chunk_size(chunk_size)
+    if manifest and compression:
+        raise ValueError("A chunk manifest cannot be kept for compressed files")
+    if io_mode == "mmap":
+        _check_mmap_options(workers, compression, suite)
     output_path = file_path + ".rsa.enc"
-    with open(output_path, 'wb') as f:
-        f.write(len(encrypted_key).to_bytes(4, 'big'))
-        f.write(encrypted_key)
-        f.write(iv)
-        f.write(encrypted_data)
+    digests = [] if manifest else None
+    tracker = _tracker(os.path.getsize(file_path), progress, cancel)
+    with _replacing(output_path, file_path) as tmp_path:
+        if io_mode == "mmap":
+            with open(file_path, 'rb') as src, open(tmp_path, 'w+b') as dst:
+                header, session_key = _new_header(public_keys, chunk_size, suite=SUITE_AES_256_GCM)
+                dst.write(header.pack())
+                _encrypt_mmap(src, dst, header, session_key, digests, tracker, content_hash)
+        elif content_hash is None and _uses_ranges(workers, compression, io_mode):
+            header = _encrypt_ranges(file_path, tmp_path, public_keys, chunk_size, workers,
+                                     digests, suite, tracker)
+        else:
+            with open(file_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                if content_hash is not None:
+                    src = _HashingReader(src, content_hash)
+                header = _encrypt_stream(_tracked(src, tracker), dst, public_keys, chunk_size, workers,
+                                         compression, io_mode, digests, suite)
 
+    if manifest:
+        _write_manifest(output_path + MANIFEST_SUFFIX, header, digests)
     return output_path
 
-def decrypt_file_rsa(file_path, private_key):
-    with open(file_path, 'rb') as f:
-        key_len = int.from_bytes(f.read(4), 'big')
-        encrypted_key = f.read(key_len)
-        iv = f.read(16)
-        encrypted_data = f.read()
-
-    try:
-        aes_key = private_key.decrypt(
-            encrypted_key,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
-    except InvalidKey:
+def _decrypt_legacy(src, dst, private_key, chunk_size):
+    # Files written before the chunked format: RSA-wrapped key, IV, AES-CFB stream.
+    if not isinstance(private_key, rsa.RSAPrivateKey):
+        raise ValueError("Files in the old format need an RSA private key")
+    key_len = int.from_bytes(src.read(4), 'big')
+    encrypted_key = src.read(key_len)
+    iv = src.read(16)
+
+    try:
+        aes_key = private_key.decrypt(encrypted_key, _oaep())
+    except (InvalidKey, ValueError):
         raise ValueError("Invalid RSA key or file format")
 
     cipher = Cipher(algorithms.AES(aes_key), modes.CFB(iv), backend=backend)
-    decryptor = cipher.decryptor()
-    decrypted_data = decryptor.update(encrypted_data) + decryptor.finalize()
+    _copy_through(cipher.decryptor(), src, dst, chunk_size)
+
+def decrypt_stream(src, dst, private_key, chunk_size=CHUNK_SIZE, workers=1, io_mode="buffered",
+                   progress=None, cancel=None):
+    # The format is told apart by the magic bytes alone, without seeking, so
+    # src may be a pipe.
+    _check_stream_io_mode(io_mode)
+    src = _tracked(src, _tracker(None, progress, cancel))
+    magic = read_full(src, len(MAGIC))
+    src = _PrefixedReader(magic, src)
+    if magic == MAGIC:
+        header = read_header(src)
+        _check_not_volume(header)
+        session_key = _unwrap_session_key(header, private_key)
+        _decrypt_chunks(src, dst, header, session_key, workers, io_mode)
+    else:
+        _decrypt_legacy(src, dst, private_key, chunk_size)
+
+def _decrypted_path(path):
+    if path.endswith(".rsa.enc"):
+        return path[:-len(".rsa.enc")] + ".dec"
+    return path + ".dec"
 
-    output_path = file_path.replace(".rsa.enc", ".dec")
-    with open(output_path, 'wb') as f:
-        f.write(decrypted_data)
+def _check_not_input(output_path, input_paths):
+    # Opening the output truncates it, so it must never be one of the inputs.
+    if os.path.exists(output_path) and any(os.path.samefile(output_path, path)
+                                           for path in input_paths):
+        raise ValueError(f"Output {output_path} is the same file as the input")
+
+def decrypt_file_rsa(file_path, private_key, chunk_size=CHUNK_SIZE, workers=1, io_mode="buffered",
+                     progress=None, cancel=None):
+    _check_io_mode(io_mode)
+    output_path = _decrypted_path(file_path)
+    _check_not_input(output_path, [file_path])
+    tracker = _tracker(os.path.getsize(file_path), progress, cancel)
+    with open(file_path, 'rb') as src:
+        header = read_header(src) if is_chunked_file(src) else None
+        if header is None:
+            direct = False
+        elif io_mode == "mmap":
+            direct = header.suite == SUITE_AES_256_GCM
+        else:
+            direct = not header.compression and _uses_ranges(workers)
+        if direct:
+            # Checked before any output is created.
+            _check_not_volume(header)
+            if io_mode == "mmap":
+                _check_mmap_options(workers)
+            session_key = _unwrap_session_key(header, private_key)
+        with _replacing(output_path, file_path) as tmp_path:
+            if direct:
+                if tracker is not None:
+                    tracker.advance(header.data_offset)
+                if io_mode == "mmap":
+                    with open(tmp_path, 'w+b') as dst:
+                        _decrypt_mmap(src, dst, header, session_key, tracker)
+                else:
+                    with open(tmp_path, 'wb') as dst:
+                        dst.truncate(_payload_layout(header, os.fstat(src.fileno()).st_size
+                                                     - header.data_offset)[1])
+                    _decrypt_ranges(file_path, tmp_path, header, session_key, workers, tracker)
+            else:
+                src.seek(0)
+                with open(tmp_path, 'wb') as dst:
+                    decrypt_stream(_tracked(src, tracker), dst, private_key, chunk_size, workers,
+                                   "buffered" if io_mode == "mmap" else io_mode)
 
     return output_path
+
+def _verify_job(cipher, job):
+    try:
+        cipher.decrypt(*job)
+        return None
+    except ValueError:
+        return job[0]
+
+def _verify_frames(src, header, chunks):
+    # Frames laid out from the file size, so a short or truncated last frame
+    # is reported as a bad chunk rather than stopping the scan.
+    for index in range(chunks):
+        yield index, index == chunks - 1, read_full(src, header.frame_size)
+
+def verify_file(file_path, private_key, workers=1):
+    # Authenticates every chunk without writing any plaintext. Unlike
+    # decryption it does not stop at the first bad chunk, so every damaged
+    # region is reported by its byte offset in the encrypted file.
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as src:
+        if not is_chunked_file(src):
+            raise ValueError("Files in the old format have no authentication tags to verify")
+        header = read_header(src)
+        session_key = _unwrap_session_key(header, private_key)
+        chunks, _ = _payload_layout(header, size - header.data_offset)
+        if _uses_ranges(workers):
+            args = (header, session_key, file_path, None, chunks)
+            bad = [index for result in _run_ranges(_RangeWorker.verify, chunks,
+                                                   _resolve_workers(workers), args)
+                   for index in result]
+        else:
+            frames = _verify_frames(src, header, chunks)
+            bad = [index for index in _map_chunks(_verify_job, frames, header, session_key)
+                   if index is not None]
+    return {"path": file_path, "bytes": size, "chunks": chunks,
+            "bad_chunks": [{"index": index, "offset": header.data_offset + index * header.frame_size}
+                           for index in bad]}
+
+def _replace_payload_copy(file_path, src, new_head, payload_offset):
+    # Fallback when the new key table does not fit: stream the untouched
+    # ciphertext behind a new header into a sibling file and swap it in.
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".rewrap")
+    try:
+        with os.fdopen(fd, 'wb') as dst:
+            dst.write(new_head)
+            src.seek(payload_offset)
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def rewrap(file_path, old_private_key, new_public_key):
+    # Re-encrypts only the session key. When the new key table fits in the
+    # space of the old one (always the case for same-size RSA keys) it is
+    # overwritten in place; the payload is never read or decrypted.
+    with open(file_path, 'r+b') as f:
+        if is_chunked_file(f):
+            header = read_header(f)
+            session_key = _unwrap_session_key(header, old_private_key)
+            old_fingerprint = key_fingerprint(old_private_key.public_key())
+            new_fingerprint = key_fingerprint(new_public_key)
+            slots = [slot for slot in header.slots if slot[1] not in (old_fingerprint, new_fingerprint)]
+            slots.append(_wrap_session_key(new_public_key, session_key))
+            new_header = FileHeader(header.suite, header.flags, header.chunk_size,
+                                    header.file_id, slots, header.key_area_len, header.volume)
+            if len(new_header.pack_key_area()) <= header.key_area_len:
+                f.seek(0)
+                f.write(new_header.pack())
+            else:
+                new_header.key_area_len = len(new_header.pack_key_area())
+                _replace_payload_copy(file_path, f, new_header.pack(), header.data_offset)
+                return file_path
+        else:
+            if not isinstance(new_public_key, rsa.RSAPublicKey):
+                raise ValueError("Files in the old format can only be rewrapped for an RSA key")
+            key_len = int.from_bytes(f.read(4), 'big')
+            try:
+                aes_key = old_private_key.decrypt(f.read(key_len), _oaep())
+            except (InvalidKey, ValueError):
+                raise ValueError("Invalid RSA key or file format")
+            wrapped = new_public_key.encrypt(aes_key, _oaep())
+            new_head = len(wrapped).to_bytes(4, 'big') + wrapped
+            if len(wrapped) == key_len:
+                f.seek(0)
+                f.write(new_head)
+            else:
+                _replace_payload_copy(file_path, f, new_head, 4 + key_len)
+                return file_path
+        f.flush()
+        os.fsync(f.fileno())
+    return file_path
+
+
+class EncryptedFile(io.RawIOBase):
+    """Read-only, seekable view of the plaintext inside a chunked file."""
+
+    def __init__(self, path, private_key):
+        super().__init__()
+        self._f = open(path, 'rb')
+        try:
+            self.header = read_header(self._f)
+            if self.header.compression:
+                raise ValueError("Compressed files can only be decrypted sequentially")
+            self._cipher = _ChunkCipher(self.header, _unwrap_session_key(self.header, private_key))
+            stored = os.fstat(self._f.fileno()).st_size - self.header.data_offset
+        except Exception:
+            self._f.close()
+            raise
+        self._chunks, self.size = _payload_layout(self.header, stored)
+        self._pos = 0
+        self._cached_index = None
+        self._cached = b""
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+        if pos < 0:
+            raise ValueError("Negative seek position")
+        self._pos = pos
+        return pos
+
+    def _chunk(self, index):
+        if index != self._cached_index:
+            header = self.header
+            self._f.seek(header.data_offset + index * header.frame_size)
+            frame = read_full(self._f, header.frame_size)
+            final = index == self._chunks - 1
+            self._cached = self._cipher.decrypt(index, final, frame)
+            self._cached_index = index
+        return self._cached
+
+    def readinto(self, b):
+        view = memoryview(b).cast("B")
+        written = 0
+        while written < len(view) and self._pos < self.size:
+            index, start = divmod(self._pos, self.header.chunk_size)
+            piece = self._chunk(index)[start:start + len(view) - written]
+            view[written:written + len(piece)] = piece
+            written += len(piece)
+            self._pos += len(piece)
+        return written
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+def open_encrypted(path, private_key):
+    return EncryptedFile(path, private_key)
+
+
+# --- Volumes ---
+#
+# encrypt_file_volumes splits the output into volumes of at most volume_size
+# bytes, each a complete container covering a run of whole chunks. Every
+# volume is written by its own worker straight from its slice of the input.
+
+VOLUME_SUFFIX_DIGITS = 3
+
+def _check_not_volume(header):
+    if header.volume is not None:
+        raise ValueError("This is one volume of a set; decrypt it with decrypt_file_volumes")
+
+def volume_path(base_path, index, count):
+    digits = max(VOLUME_SUFFIX_DIGITS, len(str(count - 1)))
+    return f"{base_path}.{index:0{digits}d}"
+
+def find_volumes(path):
+    # Accepts the base name (file.rsa.enc) or any one volume of the set.
+    base, _, suffix = path.rpartition(".")
+    if not (base and suffix.isdigit()):
+        base = path
+    directory = os.path.dirname(base) or "."
+    prefix = os.path.basename(base) + "."
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith(prefix) and name[len(prefix):].isdigit())
+
+
+class _LimitedReader:
+    def __init__(self, src, remaining):
+        self._src = src
+        self._remaining = remaining
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._src.read(size)
+        self._remaining -= len(data)
+        return data
+
+
+def _write_volume(job):
+    file_path, output_path, header, session_key, offset, length = job
+    with open(file_path, 'rb') as src, open(output_path, 'wb') as dst:
+        src.seek(offset)
+        dst.write(header.pack())
+        _encrypt_chunks(_LimitedReader(src, length), dst, header, session_key)
+    return output_path
+
+def encrypt_file_volumes(file_path, public_keys, volume_size, chunk_size=CHUNK_SIZE, workers=None,
+                         suite=None):
+    _check_chunk_size(chunk_size)
+    size = os.path.getsize(file_path)
+    template, session_key = _new_header(public_keys, chunk_size, suite=suite)
+    data_offset = template.data_offset + _VOLUME.size
+    per_volume = (volume_size - data_offset) // template.frame_size
+    if per_volume < 1:
+        raise ValueError(f"volume_size must be at least {data_offset + template.frame_size} bytes "
+                         f"for {chunk_size}-byte chunks")
+    chunks = max(1, -(-size // chunk_size))
+    count = -(-chunks // per_volume)
+
+    base_path = file_path + ".rsa.enc"
+    outputs = [volume_path(base_path, index, count) for index in range(count)]
+    jobs = []
+    try:
+        for index in range(count):
+            first = index * per_volume
+            header = FileHeader(template.suite, template.flags, chunk_size, template.file_id,
+                                template.slots, volume=(index, count, first))
+            offset = first * chunk_size
+            jobs.append((file_path, _temp_sibling(outputs[index]), header, session_key,
+                         offset, min(per_volume * chunk_size, size - offset)))
+
+        workers = min(_resolve_workers(workers), count)
+        if workers == 1:
+            for job in jobs:
+                _write_volume(job)
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                list(pool.map(_write_volume, jobs))
+    except BaseException:
+        for job in jobs:
+            _discard(job[1])
+        raise
+    for job, output_path in zip(jobs, outputs):
+        _install(job[1], output_path, file_path)
+    # Volumes left from an earlier run that needed more of them would
+    # otherwise be found with the new set and make it unreadable.
+    current = {os.path.abspath(path) for path in outputs}
+    for path in find_volumes(base_path):
+        if os.path.abspath(path) not in current:
+            _discard(path)
+    return outputs
+
+def _read_volume_set(paths):
+    # Orders the volumes and checks that they form one complete set.
+    volumes = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            header = read_header(f)
+        if header.volume is None:
+            raise ValueError(f"{path} is not a volume")
+        volumes.append((header.volume[0], path, header))
+    if not volumes:
+        raise ValueError("No volumes given")
+    volumes.sort(key=lambda volume: volume[0])
+
+    count = volumes[0][2].volume[1]
+    file_id = volumes[0][2].file_id
+    indexes = [index for index, _, _ in volumes]
+    if any(header.file_id != file_id or header.volume[1] != count for _, _, header in volumes):
+        raise ValueError("Volumes belong to different files")
+    missing = sorted(set(range(count)) - set(indexes))
+    if missing:
+        raise ValueError(f"Volume set is incomplete: missing {', '.join(map(str, missing))} of {count}")
+    if len(indexes) != count:
+        raise ValueError("Volume set contains duplicates")
+
+    next_chunk = 0
+    for index, path, header in volumes:
+        if header.first_chunk != next_chunk:
+            raise ValueError(f"Volume {index} does not continue where volume {index - 1} ends")
+        chunks, _ = _payload_layout(header, os.path.getsize(path) - header.data_offset)
+        next_chunk += chunks
+    return [(path, header) for _, path, header in volumes]
+
+def decrypt_file_volumes(paths, private_key, output_path=None, workers=1, progress=None, cancel=None):
+    # paths is the list of volumes, or one path accepted by find_volumes.
+    if isinstance(paths, str):
+        paths = find_volumes(paths)
+    volumes = _read_volume_set(paths)
+    if output_path is None:
+        output_path = _decrypted_path(volumes[0][0].rpartition(".")[0])
+    _check_not_input(output_path, [path for path, _ in volumes])
+    session_key = _unwrap_session_key(volumes[0][1], private_key)
+    tracker = _tracker(sum(os.path.getsize(path) for path, _ in volumes), progress, cancel)
+    with _replacing(output_path, volumes[0][0]) as tmp_path, open(tmp_path, 'wb') as dst:
+        for path, header in volumes:
+            if tracker is not None:
+                tracker.advance(header.data_offset)
+            if _uses_ranges(workers):
+                _decrypt_ranges(path, tmp_path, header, session_key, workers, tracker,
+                                header.first_chunk * header.chunk_size)
+                continue
+            with open(path, 'rb') as src:
+                src.seek(header.data_offset)
+                _decrypt_chunks(_tracked(src, tracker), dst, header, session_key)
+    return output_path
+
+
+# --- Incremental re-encryption ---
+#
+# A manifest next to the encrypted file keeps a keyed digest of every
+# plaintext chunk. When the source changes, only chunks whose digest differs
+# are encrypted again (with a fresh nonce) and written over their frame in
+# place; the file is then truncated to the new length.
+
+MANIFEST_SUFFIX = ".manifest"
+
+def _manifest_key(session_key):
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                info=b"FileEnc chunk manifest").derive(session_key)
+
+def _chunk_digest(key, block):
+    return hmac.new(key, block, hashlib.sha256).hexdigest()
+
+
+class _DigestingReader:
+    # Records the manifest digest of each chunk_size block read through it.
+    def __init__(self, src, key, chunk_size, digests):
+        self._src = src
+        self._key = key
+        self._chunk_size = chunk_size
+        self._digests = digests
+        self._empty = True
+
+    def read(self, size=-1):
+        block = read_full(self._src, self._chunk_size)
+        if block or self._empty:
+            self._digests.append(_chunk_digest(self._key, block))
+        self._empty = False
+        return block
+
+
+def _write_manifest(path, header, digests):
+    data = {"file_id": header.file_id.hex(), "chunk_size": header.chunk_size, "chunks": digests}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _load_manifest(path, header):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("file_id") != header.file_id.hex() or data.get("chunk_size") != header.chunk_size:
+        return None
+    return data["chunks"]
+
+def _rebuild_manifest(f, header, session_key):
+    # No usable manifest: decrypt (and so authenticate) the file once to build it.
+    key = _manifest_key(session_key)
+    cipher = _ChunkCipher(header, session_key)
+    f.seek(header.data_offset)
+    return [_chunk_digest(key, cipher.decrypt(*job)) for job in _cipher_frames(f, header)]
+
+def update_encrypted_file(file_path, private_key, check=False):
+    encrypted_path = file_path + ".rsa.enc"
+    manifest_path = encrypted_path + MANIFEST_SUFFIX
+    with open(file_path, 'rb') as src, open(encrypted_path, 'rb' if check else 'r+b') as f:
+        header = read_header(f)
+        if header.compression:
+            raise ValueError("Compressed files cannot be updated incrementally")
+        session_key = _unwrap_session_key(header, private_key)
+        old = _load_manifest(manifest_path, header)
+        if old is None:
+            old = _rebuild_manifest(f, header, session_key)
+
+        key = _manifest_key(session_key)
+        cipher = _ChunkCipher(header, session_key)
+        digests = []
+        changed = []
+        old_last = len(old) - 1
+        for index, final, block in _plain_chunks(src, header.chunk_size):
+            digest = _chunk_digest(key, block)
+            digests.append(digest)
+            # The old last chunk carries the final flag, so it must be redone
+            # whenever the chunk count changes even if its bytes did not.
+            if index > old_last or old[index] != digest or (index == old_last) != final:
+                changed.append(index)
+                if not check:
+                    f.seek(header.data_offset + index * header.frame_size)
+                    f.write(cipher.encrypt(index, final, block))
+
+        if not check:
+            last_frame = NONCE_SIZE + len(block) + TAG_SIZE
+            f.truncate(header.data_offset + (len(digests) - 1) * header.frame_size + last_frame)
+            f.flush()
+            os.fsync(f.fileno())
+            _write_manifest(manifest_path, header, digests)
+
+    return {"chunks": len(digests), "changed": changed,
+            "removed": max(0, len(old) - len(digests))}
+
+
+# --- Batch command line ---
+
+ENCRYPTED_SUFFIX = ".rsa.enc"
+STATE_SUFFIX = ".fileenc-state"
+
+def iter_files(paths, decrypting=False):
+    # When decrypting, volumes are listed one by one like any encrypted file;
+    # rewrap and verify handle them per volume, run_batch regroups them.
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    candidate = os.path.join(root, name)
+                    if name.endswith((MANIFEST_SUFFIX, STATE_SUFFIX)):
+                        continue
+                    if is_volume_path(name):
+                        if decrypting:
+                            yield candidate
+                    elif name.endswith(ENCRYPTED_SUFFIX) == decrypting:
+                        yield candidate
+        else:
+            yield path
+
+
+_batch_key = None
+
+def _init_batch_worker(loader, key_paths):
+    # Each worker parses its keys once and reuses them for every file it handles.
+    global _batch_key
+    keys = [loader(path) for path in key_paths]
+    _batch_key = keys if len(keys) > 1 else keys[0]
+
+def _record(st, digest):
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest.hexdigest()}
+
+def _file_record(path):
+    # Stats first, then hashes, so a file modified while being read is caught
+    # by its mtime on the next run.
+    st = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return _record(st, digest)
+
+def _batch_encrypt(job, compression=None, track=False, io_mode="buffered", suite=None):
+    # job is a path, or (path, known_sha256) when a state file is in use. A
+    # known hash means the file kept its size but has a new mtime: it is
+    # hashed first and skipped (size None) if only touched. Any other tracked
+    # file is hashed while it is encrypted, so it is read once.
+    path, known = job if isinstance(job, tuple) else (job, None)
+    try:
+        record = None
+        if track and known is not None:
+            record = _file_record(path)
+            if record["sha256"] == known and os.path.exists(path + ENCRYPTED_SUFFIX):
+                return path, None, None, record
+        st = os.stat(path)
+        content_hash = hashlib.sha256() if track and record is None else None
+        encrypt_file_rsa(path, _batch_key, compression=compression, io_mode=io_mode, suite=suite,
+                         content_hash=content_hash)
+        if content_hash is not None:
+            record = _record(st, content_hash)
+        return path, st.st_size, None, record
+    except Exception as e:
+        return path, 0, str(e), None
+
+def _batch_decrypt(path, io_mode="buffered"):
+    try:
+        size = os.path.getsize(path)
+        decrypt_file_rsa(path, _batch_key, io_mode=io_mode)
+        return path, size, None, None
+    except Exception as e:
+        return path, 0, str(e), None
+
+def _init_rewrap_worker(old_private_key_path, new_public_key_path):
+    global _batch_key
+    _batch_key = (load_private_key(old_private_key_path), load_public_key(new_public_key_path))
+
+def _batch_rewrap(path):
+    try:
+        size = os.path.getsize(path)
+        rewrap(path, *_batch_key)
+        return path, size, None, None
+    except Exception as e:
+        return path, 0, str(e), None
+
+def _verify_one(path, private_key, workers=1):
+    try:
+        result = verify_file(path, private_key, workers)
+    except Exception as e:
+        return path, 0, str(e), {"path": path, "error": str(e)}
+    error = None
+    if result["bad_chunks"]:
+        offsets = ", ".join(str(bad["offset"]) for bad in result["bad_chunks"][:10])
+        more = ", ..." if len(result["bad_chunks"]) > 10 else ""
+        error = (f"{len(result['bad_chunks'])} of {result['chunks']} chunks failed authentication "
+                 f"(offsets {offsets}{more})")
+    return path, result["bytes"], error, result
+
+def _batch_verify(path):
+    return _verify_one(path, _batch_key)
+
+def _run_pool(func, files, initializer, initargs, jobs, summary=None):
+    if summary is None:
+        summary = {"files": 0, "skipped": 0, "bytes": 0, "failures": [], "records": {}}
+
+    start = time.perf_counter()
+    if files:
+        with ProcessPoolExecutor(_resolve_workers(jobs), initializer=initializer,
+                                 initargs=initargs) as pool:
+            _tally(summary, pool.map(func, files, chunksize=8))
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+def _tally(summary, results):
+    for path, size, error, record in results:
+        if error:
+            summary["failures"].append((path, error))
+        elif size is None:
+            summary["skipped"] += 1
+        else:
+            summary["files"] += 1
+            summary["bytes"] += size
+        if record:
+            summary["records"][path] = record
+
+def load_state(state_path):
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_state(state_path, state):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, state_path)
+
+def _plan_incremental(files, state, summary):
+    # Stat-only pass: files whose size and mtime match the state are skipped
+    # without being opened. Same-size files with a new mtime are handed to the
+    # workers with their old hash, so only those get hashed before deciding.
+    jobs = []
+    for path in files:
+        key = os.path.abspath(path)
+        entry = state.get(key)
+        try:
+            st = os.stat(path)
+        except OSError:
+            jobs.append((path, None))
+            continue
+        if (entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns
+                and os.path.exists(path + ENCRYPTED_SUFFIX)):
+            summary["skipped"] += 1
+            continue
+        known = entry["sha256"] if entry and entry["size"] == st.st_size else None
+        jobs.append((path, known))
+    return jobs
+
+def run_batch(decrypting, paths, key_paths, jobs=None, compression=None, state_path=None,
+              io_mode="buffered", suite=None):
+    loader = load_private_key if decrypting else load_public_key
+    if isinstance(key_paths, str):
+        key_paths = [key_paths]
+    files = list(iter_files(paths, decrypting))
+    if not decrypting and suite is None and io_mode != "mmap":
+        # Settled once here so the workers do not all run the benchmark.
+        suite = cipher_suites.preferred_suite()
+    initargs = (loader, list(key_paths))
+    if decrypting:
+        volumes = [path for path in files if is_volume_path(path)]
+        files = [path for path in files if not is_volume_path(path)]
+        func = functools.partial(_batch_decrypt, io_mode=io_mode)
+        summary = _run_pool(func, files, _init_batch_worker, initargs, jobs)
+        if volumes:
+            sets = run_volumes(True, volumes, key_paths, jobs)
+            for key in ("files", "bytes", "failures", "seconds"):
+                summary[key] += sets[key]
+        return summary
+    if not state_path:
+        func = functools.partial(_batch_encrypt, compression=compression, io_mode=io_mode, suite=suite)
+        return _run_pool(func, files, _init_batch_worker, initargs, jobs)
+
+    state = load_state(state_path)
+    summary = {"files": 0, "skipped": 0, "bytes": 0, "failures": [], "records": {}}
+    start = time.perf_counter()
+    work = _plan_incremental(files, state, summary)
+    func = functools.partial(_batch_encrypt, compression=compression, track=True, io_mode=io_mode,
+                             suite=suite)
+    _run_pool(func, work, _init_batch_worker, initargs, jobs, summary)
+    for path, record in summary["records"].items():
+        state[os.path.abspath(path)] = record
+    save_state(state_path, state)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+def rewrap_directory(paths, old_private_key_path, new_public_key_path, jobs=None):
+    if isinstance(paths, str):
+        paths = [paths]
+    files = list(iter_files(paths, decrypting=True))
+    return _run_pool(_batch_rewrap, files, _init_rewrap_worker,
+                     (old_private_key_path, new_public_key_path), jobs)
+
+def scrub(paths, private_key_path, jobs=None, report_path=None):
+    # Verifies every .rsa.enc file under paths, one file per worker. A single
+    # file is instead split across the workers chunk by chunk.
+    if isinstance(paths, str):
+        paths = [paths]
+    files = list(iter_files(paths, decrypting=True))
+    if len(files) == 1:
+        summary = {"files": 0, "skipped": 0, "bytes": 0, "failures": [], "records": {}}
+        start = time.perf_counter()
+        _tally(summary, [_verify_one(files[0], load_private_key(private_key_path), jobs)])
+        summary["seconds"] = time.perf_counter() - start
+    else:
+        summary = _run_pool(_batch_verify, files, _init_batch_worker,
+                            (load_private_key, [private_key_path]), jobs)
+
+    records = summary["records"].values()
+    scanned = sum(record.get("bytes", 0) for record in records)
+    seconds = max(summary["seconds"], 1e-9)
+    report = {
+        "files": len(files),
+        "ok": summary["files"],
+        "failed": len(summary["failures"]),
+        "chunks": sum(record.get("chunks", 0) for record in records),
+        "bytes": scanned,
+        "seconds": round(summary["seconds"], 3),
+        "mb_per_s": round(scanned / (1024 * 1024) / seconds, 1),
+        "files_per_s": round(len(files) / seconds, 1),
+        "failures": [dict(summary["records"].get(path, {"path": path}), error=error)
+                     for path, error in summary["failures"]],
+    }
+    if report_path:
+        save_state(report_path, report)
+    summary["report"] = report
+    return summary
+
+def parse_size(text):
+    # "5G", "500M", "64k" or a plain byte count.
+    units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+    text = text.strip().lower().rstrip("b")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def is_volume_path(path):
+    base, _, suffix = path.rpartition(".")
+    return suffix.isdigit() and base.endswith(ENCRYPTED_SUFFIX)
+
+def run_volumes(decrypting, paths, key_paths, jobs=None, volume_size=None, suite=None):
+    # Encrypts each file into volumes, or decrypts each volume set named by
+    # paths (one volume of a set is enough to find the rest).
+    if isinstance(key_paths, str):
+        key_paths = [key_paths]
+    summary = {"files": 0, "bytes": 0, "failures": []}
+    start = time.perf_counter()
+    if decrypting:
+        sets = {}
+        for path in paths:
+            sets.setdefault(path.rpartition(".")[0], []).append(path)
+        private_key = load_private_key(key_paths[0])
+        for base, members in sets.items():
+            try:
+                volumes = members if len(members) > 1 else find_volumes(base)
+                size = sum(os.path.getsize(path) for path in volumes)
+                decrypt_file_volumes(volumes, private_key, workers=jobs or 1)
+                summary["files"] += 1
+                summary["bytes"] += size
+            except Exception as e:
+                summary["failures"].append((base, e))
+    else:
+        public_keys = [load_public_key(path) for path in key_paths]
+        for path in iter_files(paths):
+            try:
+                encrypt_file_volumes(path, public_keys, volume_size, workers=jobs, suite=suite)
+                summary["files"] += 1
+                summary["bytes"] += os.path.getsize(path)
+            except Exception as e:
+                summary["failures"].append((path, e))
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+class _CountingReader:
+    def __init__(self, src):
+        self._src = src
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self._src.read(size)
+        self.count += len(data)
+        return data
+
+
+def run_stream(decrypting, source, output, key_paths, jobs=1, compression=None, io_mode="buffered",
+               suite=None):
+    # One input to one output, either of which may be "-" for stdin/stdout.
+    # Nothing but the output is written, so plaintext never touches the disk
+    # when piping.
+    if isinstance(key_paths, str):
+        key_paths = [key_paths]
+    summary = {"files": 0, "bytes": 0, "failures": []}
+    start = time.perf_counter()
+    src = dst = tmp_path = None
+    try:
+        src = sys.stdin.buffer if source == "-" else open(source, 'rb')
+        if output == "-":
+            dst = sys.stdout.buffer
+        else:
+            if source != "-":
+                _check_not_input(output, [source])
+            tmp_path = _temp_sibling(output)
+            dst = open(tmp_path, 'wb')
+        counter = _CountingReader(src)
+        if decrypting:
+            decrypt_stream(counter, dst, load_private_key(key_paths[0]), workers=jobs, io_mode=io_mode)
+        else:
+            encrypt_stream(counter, dst, [load_public_key(path) for path in key_paths], workers=jobs,
+                           compression=compression, io_mode=io_mode, suite=suite)
+        dst.flush()
+        summary["files"] = 1
+        summary["bytes"] = counter.count
+    except Exception as e:
+        summary["failures"].append((source, e))
+    finally:
+        if src is not None and src is not sys.stdin.buffer:
+            src.close()
+        if dst is not None and dst is not sys.stdout.buffer:
+            dst.close()
+        if tmp_path is not None:
+            if summary["files"]:
+                _install(tmp_path, output, None if source == "-" else source)
+            else:
+                _discard(tmp_path)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+def print_summary(action, summary, out=sys.stdout):
+    seconds = max(summary["seconds"], 1e-9)
+    mb = summary["bytes"] / (1024 * 1024)
+    skipped = f"{summary['skipped']} unchanged, " if summary.get("skipped") else ""
+    print(f"{action} {summary['files']} files ({mb:.1f} MB) in {summary['seconds']:.2f} s: "
+          f"{summary['files'] / seconds:.1f} files/s, {mb / seconds:.1f} MB/s, "
+          f"{skipped}{len(summary['failures'])} failed", file=out)
+    for path, error in summary["failures"]:
+        print(f"FAILED {path}: {error}", file=out)
+
+def benchmark_key_wrapping(rounds=20, out=sys.stdout):
+    # Compares key generation, wrap and unwrap cost of the two key types.
+    results = {}
+    session_key = os.urandom(32)
+    for name, generate, keygen_rounds in (("RSA-4096", generate_rsa_keypair, 2),
+                                          ("X25519", generate_x25519_keypair, rounds)):
+        start = time.perf_counter()
+        for _ in range(keygen_rounds):
+            private_key, public_key = generate()
+        keygen = (time.perf_counter() - start) / keygen_rounds
+
+        header = FileHeader(SUITE_AES_256_GCM, 0, CHUNK_SIZE, os.urandom(16), [])
+        start = time.perf_counter()
+        for _ in range(rounds):
+            header.slots = [_wrap_session_key(public_key, session_key)]
+        wrap = (time.perf_counter() - start) / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            _unwrap_session_key(header, private_key)
+        unwrap = (time.perf_counter() - start) / rounds
+
+        results[name] = {"keygen": keygen, "wrap": wrap, "unwrap": unwrap}
+        print(f"{name:>9}: keygen {keygen * 1e6:12.1f} us, wrap {wrap * 1e6:9.1f} us, "
+              f"unwrap {unwrap * 1e6:9.1f} us", file=out)
+    return results
+
+def benchmark_ciphers(out=sys.stdout):
+    # Re-measures the cipher suites and stores the new choice for this host.
+    suite = cipher_suites.preferred_suite(refresh=True)
+    for name, speed in cipher_suites.cached_results()["mb_per_s"].items():
+        print(f"{name:>17}: {speed:8.1f} MB/s", file=out)
+    print(f"New files will use {cipher_suites.suite_name(suite)}", file=out)
+    return suite
+
+def benchmark_io_modes(size_mb=256, out=sys.stdout):
+    # Times encrypt and decrypt of one temporary file in every io_mode.
+    private_key, public_key = generate_x25519_keypair()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.bin")
+        with open(path, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+        for io_mode in IO_MODES:
+            start = time.perf_counter()
+            encrypted = encrypt_file_rsa(path, public_key, io_mode=io_mode)
+            encrypt_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            decrypt_file_rsa(encrypted, private_key, io_mode=io_mode)
+            decrypt_seconds = time.perf_counter() - start
+            results[io_mode] = {"encrypt": size_mb / encrypt_seconds, "decrypt": size_mb / decrypt_seconds}
+            print(f"{io_mode:>9}: encrypt {results[io_mode]['encrypt']:8.1f} MB/s, "
+                  f"decrypt {results[io_mode]['decrypt']:8.1f} MB/s", file=out)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m FileEnc",
+                                     description="Encrypt or decrypt files and directories with RSA or X25519 keys.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enc = sub.add_parser("encrypt", help="encrypt files, walking directories recursively")
+    enc.add_argument("--pubkey", required=True, action="append",
+                     help="recipient public key (.pem); repeat to encrypt for several recipients")
+    enc.add_argument("--compress", choices=["auto", "zlib", "lzma", "zstd"], default=None,
+                     help="compress before encrypting; 'auto' skips incompressible files")
+    enc.add_argument("--state", default=None,
+                     help="state file recording encrypted files; unchanged files are skipped")
+    enc.add_argument("--volume-size", type=parse_size, default=None,
+                     help="split each output into volumes of at most this size (e.g. 5G), written in parallel")
+    enc.add_argument("--cipher", choices=["auto"] + [name.lower() for name, _ in cipher_suites.SUITES.values()],
+                     default="auto", help="cipher suite; 'auto' uses the fastest one on this machine")
+    enc.add_argument("paths", nargs="+", help="files or directories; '-' reads from stdin")
+
+    dec = sub.add_parser("decrypt", help="decrypt .rsa.enc files, walking directories recursively")
+    dec.add_argument("--privkey", required=True, help="private key (.pem)")
+    dec.add_argument("paths", nargs="+",
+                     help="files, directories or volumes (file.rsa.enc.000); '-' reads from stdin")
+
+    rew = sub.add_parser("rewrap", help="re-encrypt only the key header of .rsa.enc files for a new key")
+    rew.add_argument("--privkey", required=True, help="private key being retired (.pem)")
+    rew.add_argument("--pubkey", required=True, help="replacement public key (.pem)")
+    rew.add_argument("paths", nargs="+")
+
+    upd = sub.add_parser("update", help="re-encrypt only the changed chunks of previously encrypted files")
+    upd.add_argument("--privkey", required=True, help="private key (.pem)")
+    upd.add_argument("--check", action="store_true", help="only report which chunks differ")
+    upd.add_argument("files", nargs="+", help="plaintext files whose .rsa.enc copy should be updated")
+
+    ver = sub.add_parser("verify", help="check every chunk of .rsa.enc files without decrypting to disk")
+    ver.add_argument("--privkey", required=True, help="private key (.pem)")
+    ver.add_argument("--report", default=None, help="write a JSON report to this file")
+    ver.add_argument("paths", nargs="+")
+
+    for command in (enc, dec, rew, ver):
+        command.add_argument("-j", "--jobs", type=int, default=None,
+                             help="worker processes (default: one per CPU)")
+    for command in (enc, dec):
+        command.add_argument("--io-mode", choices=IO_MODES, default="buffered",
+                             help="'pipelined' overlaps reads and writes with encryption")
+        command.add_argument("-o", "--output", default=None,
+                             help="output file for a single input, '-' for stdout "
+                                  "(default when reading from stdin)")
+
+    keygen = sub.add_parser("keygen", help="generate RSA keypairs in parallel")
+    keygen.add_argument("--count", type=int, default=1)
+    keygen.add_argument("--out", default=".", help="directory for the .pem files")
+    keygen.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+
+    bench = sub.add_parser("bench", help="benchmark key wrapping (keys), the cipher suites (ciphers) "
+                                         "or the I/O modes (io)")
+    bench.add_argument("what", nargs="?", choices=["keys", "ciphers", "io"], default="keys")
+    bench.add_argument("--rounds", type=int, default=20)
+    bench.add_argument("--size", type=int, default=256, help="test file size in MB for 'io'")
+
+    args = parser.parse_args(argv)
+    suite = None
+    if args.command == "encrypt" and args.cipher != "auto":
+        suite = cipher_suites.suite_by_name(args.cipher)
+    if args.command in ("encrypt", "decrypt") and ("-" in args.paths or args.output):
+        if len(args.paths) != 1:
+            parser.error("stdin and --output take exactly one input")
+        if args.command == "encrypt" and args.state:
+            parser.error("--state cannot be used with stdin or --output")
+        if args.command == "encrypt" and args.volume_size:
+            parser.error("--volume-size cannot be used with stdin or --output")
+        if args.io_mode == "mmap":
+            parser.error("--io-mode mmap cannot be used with stdin or --output")
+        decrypting = args.command == "decrypt"
+        summary = run_stream(decrypting, args.paths[0], args.output or "-",
+                             args.privkey if decrypting else args.pubkey, args.jobs or 1,
+                             None if decrypting else args.compress, args.io_mode, suite)
+        # Keep stdout clean for the data when it is the output.
+        print_summary("Decrypted" if decrypting else "Encrypted", summary,
+                      sys.stderr if (args.output or "-") == "-" else sys.stdout)
+        return 1 if summary["failures"] else 0
+    if args.command == "encrypt" and args.volume_size:
+        if args.compress or args.state or args.io_mode != "buffered":
+            parser.error("--volume-size cannot be combined with --compress, --state or --io-mode")
+        summary = run_volumes(False, args.paths, args.pubkey, args.jobs, args.volume_size, suite)
+        print_summary("Encrypted", summary)
+    elif args.command == "encrypt":
+        summary = run_batch(False, args.paths, args.pubkey, args.jobs, args.compress, args.state,
+                            args.io_mode, suite)
+        print_summary("Encrypted", summary)
+    elif args.command == "update":
+        private_key = load_private_key(args.privkey)
+        failed = False
+        for path in args.files:
+            try:
+                result = update_encrypted_file(path, private_key, check=args.check)
+            except Exception as e:
+                print(f"FAILED {path}: {e}")
+                failed = True
+                continue
+            verb = "differ" if args.check else "re-encrypted"
+            print(f"{path}: {len(result['changed'])} of {result['chunks']} chunks {verb}"
+                  + (f" {result['changed']}" if args.check and result['changed'] else ""))
+        return 1 if failed else 0
+    elif args.command == "keygen":
+        os.makedirs(args.out, exist_ok=True)
+        start = time.perf_counter()
+        keys = generate_many(args.count, args.jobs)
+        for number, (private_key, public_key) in enumerate(keys, 1):
+            base = os.path.join(args.out, f"key{number:04d}")
+            save_keys(private_key, public_key, base, base)
+        print(f"Generated {len(keys)} keypairs in {time.perf_counter() - start:.2f} s")
+        return 0
+    elif args.command == "bench":
+        if args.what == "io":
+            benchmark_io_modes(args.size)
+        elif args.what == "ciphers":
+            benchmark_ciphers()
+        else:
+            benchmark_key_wrapping(args.rounds)
+        return 0
+    elif args.command == "verify":
+        summary = scrub(args.paths, args.privkey, args.jobs, args.report)
+        print_summary("Verified", summary)
+    elif args.command == "decrypt":
+        summary = run_batch(True, args.paths, args.privkey, args.jobs, io_mode=args.io_mode)
+        print_summary("Decrypted", summary)
+    else:
+        summary = rewrap_directory(args.paths, args.privkey, args.pubkey, args.jobs)
+        print_summary("Rewrapped", summary)
+    return 1 if summary["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,11 @@
 import sys
+import time
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QFileDialog, QWidget, QVBoxLayout, QLabel, QPushButton,
-    QTabWidget, QLineEdit, QMessageBox, QHBoxLayout
+    QTabWidget, QLineEdit, QMessageBox, QHBoxLayout, QProgressBar
 )
 from PyQt5.QtGui import QFont, QIcon, QPalette, QColor
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtWidgets import QSpacerItem, QSizePolicy
 
 import FileEnc as core
@@ -32,10 +33,44 @@ class FileDropLabel(QLabel):
             self.file_path = file_path
 
 
+class CryptoWorker(QThread):
+    # Runs a core encrypt/decrypt call off the UI thread. Progress is passed
+    # on at most ten times a second; sizes are sent as objects since they can
+    # exceed a C int.
+    progress = pyqtSignal(object, object)
+    succeeded = pyqtSignal(str)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, func, *args, parent=None):
+        super().__init__(parent)
+        self.func = func
+        self.args = args
+        self.cancel_token = core.CancelToken()
+        self._last_report = 0.0
+
+    def report(self, done, total):
+        now = time.monotonic()
+        if now - self._last_report >= 0.1 or done == total:
+            self._last_report = now
+            self.progress.emit(done, total)
+
+    def run(self):
+        try:
+            output = self.func(*self.args, progress=self.report, cancel=self.cancel_token)
+        except core.OperationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.succeeded.emit(output)
+
+
 class FileEncryptionApp(QMainWindow):
     def __init__(self, parent_window=None):
         super().__init__()
         self.parent_window = parent_window  # Store parent reference
+        self.worker = None
         self.setWindowTitle("Secure File Vault")
         self.setGeometry(300, 100, 700, 500)
         self.setWindowIcon(QIcon("lock.png"))
@@ -117,6 +152,20 @@ class FileEncryptionApp(QMainWindow):
         self.init_encrypt_tab()
         self.init_decrypt_tab()
         self.init_key_tab()
+
+        # Progress of the running encryption or decryption, hidden when idle
+        progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setTextVisible(False)
+        self.progress_label = QLabel("")
+        self.cancel_btn = QPushButton("✖ Cancel")
+        self.cancel_btn.clicked.connect(self.cancel_operation)
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.progress_label)
+        progress_layout.addWidget(self.cancel_btn)
+        layout.addLayout(progress_layout)
+        self.set_busy(False)
         
     def create_page_layout(self, title):
         layout = QVBoxLayout()
@@ -139,7 +188,7 @@ class FileEncryptionApp(QMainWindow):
 
         key_layout = QHBoxLayout()
         self.public_key_path = QLineEdit()
-        self.public_key_path.setPlaceholderText("Path to recipient's public key (.pem)")
+        self.public_key_path.setPlaceholderText("Path to recipient's public key (.pem); separate several with ;")
         self.enc_key_browse = QPushButton("📁 Browse Public Key")
         self.enc_key_browse.clicked.connect(lambda: self.load_key_file(self.public_key_path))
         key_layout.addWidget(self.public_key_path)
@@ -192,20 +241,24 @@ class FileEncryptionApp(QMainWindow):
         self.decrypt_tab.setLayout(layout)
 
     def init_key_tab(self):
-        layout = self.create_page_layout("RSA Key Management")
-        self.key_status = QLabel("To Generate RSA Key Pair click on the button below!")
+        layout = self.create_page_layout("Key Management")
+        self.key_status = QLabel("To Generate a Key Pair click on one of the buttons below!")
         self.key_status.setFont(QFont("Times New Roman", 10))
         layout.addSpacing(50)
 
         self.gen_keys_btn = QPushButton("🗝️ Generate RSA Keypair")
-        self.gen_keys_btn.clicked.connect(self.generate_keys)
+        self.gen_keys_btn.clicked.connect(lambda: self.generate_keys("RSA"))
+
+        self.gen_x25519_btn = QPushButton("⚡ Generate X25519 Keypair (fast)")
+        self.gen_x25519_btn.clicked.connect(lambda: self.generate_keys("X25519"))
 
-        info = QLabel("Generates a pair of RSA keys (public and private) and saves them.")
+        info = QLabel("Generates a pair of keys (public and private) and saves them.")
         info.setAlignment(Qt.AlignCenter)
         info.setStyleSheet("color: gray; font-style: italic; margin-top: 12px;")
 
         layout.addWidget(self.key_status)
         layout.addWidget(self.gen_keys_btn)
+        layout.addWidget(self.gen_x25519_btn)
         layout.addStretch(9)
         layout.addWidget(info)
 
@@ -232,29 +285,79 @@ class FileEncryptionApp(QMainWindow):
         file_path = self.enc_file_label.file_path
         pub_key_path = self.public_key_path.text()
         try:
-            pub_key = core.load_public_key(pub_key_path)
-            output = core.encrypt_file_rsa(file_path, pub_key)
-            QMessageBox.information(self, "Success", f"Encrypted file saved as:\n{output}")
+            pub_keys = [core.load_public_key(path.strip()) for path in pub_key_path.split(";") if path.strip()]
         except Exception as e:
             QMessageBox.critical(self, "Error", str(e))
+            return
+        self.start_worker("Encrypted", core.encrypt_file_rsa, file_path, pub_keys)
 
     def decrypt_file(self):
         file_path = self.dec_file_label.file_path
         priv_key_path = self.private_key_path.text()
         try:
             priv_key = core.load_private_key(priv_key_path)
-            output = core.decrypt_file_rsa(file_path, priv_key)
-            QMessageBox.information(self, "Success", f"Decrypted file saved as:\n{output}")
         except Exception as e:
             QMessageBox.critical(self, "Error", str(e))
-
-    def generate_keys(self):
-        priv_key, pub_key = core.generate_rsa_keypair()
+            return
+        self.start_worker("Decrypted", core.decrypt_file_rsa, file_path, priv_key)
+
+    def start_worker(self, action, func, *args):
+        if not args[0]:
+            QMessageBox.warning(self, "Missing File", "Please choose a file first.")
+            return
+        self.worker = CryptoWorker(func, *args, parent=self)
+        self.worker.progress.connect(self.show_progress)
+        self.worker.succeeded.connect(
+            lambda output: QMessageBox.information(self, "Success", f"{action} file saved as:\n{output}"))
+        self.worker.failed.connect(lambda error: QMessageBox.critical(self, "Error", error))
+        self.worker.cancelled.connect(
+            lambda: QMessageBox.information(self, "Cancelled", "Operation cancelled; existing files were left unchanged."))
+        self.worker.finished.connect(lambda: self.set_busy(False))
+        self.started_at = time.monotonic()
+        self.progress_bar.setValue(0)
+        self.progress_label.setText("Starting...")
+        self.set_busy(True)
+        self.worker.start()
+
+    def set_busy(self, busy):
+        for widget in (self.progress_bar, self.progress_label, self.cancel_btn):
+            widget.setVisible(busy)
+        self.cancel_btn.setEnabled(busy)
+        self.encrypt_btn.setEnabled(not busy)
+        self.decrypt_btn.setEnabled(not busy)
+
+    def show_progress(self, done, total):
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        rate = done / elapsed
+        if total:
+            self.progress_bar.setValue(int(1000 * done / total))
+        eta = f", {int((total - done) / rate)} s left" if total and rate > 0 else ""
+        self.progress_label.setText(f"{done / (1024 * 1024):.0f} MB, {rate / (1024 * 1024):.1f} MB/s{eta}")
+
+    def cancel_operation(self):
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.cancel_token.cancel()
+            self.cancel_btn.setEnabled(False)
+            self.progress_label.setText("Cancelling...")
+
+    def closeEvent(self, event):
+        # The worker removes its temporary output before it exits.
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.cancelled.disconnect()
+            self.worker.cancel_token.cancel()
+            self.worker.wait()
+        super().closeEvent(event)
+
+    def generate_keys(self, kind="RSA"):
+        if kind == "X25519":
+            priv_key, pub_key = core.generate_x25519_keypair()
+        else:
+            priv_key, pub_key = core.generate_rsa_keypair()
         priv_path, _ = QFileDialog.getSaveFileName(self, "Save Private Key", filter="*.pem")
         pub_path, _ = QFileDialog.getSaveFileName(self, "Save Public Key", filter="*.pem")
         if priv_path and pub_path:
-            core.save_rsa_keys(priv_key, pub_key, priv_path, pub_path)
-            self.key_status.setText("RSA Keypair saved successfully.")
+            core.save_keys(priv_key, pub_key, priv_path, pub_path)
+            self.key_status.setText(f"{kind} Keypair saved successfully.")
         else:
             self.key_status.setText("Key generation canceled.")
 
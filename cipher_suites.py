@@ -0,0 +1,112 @@
+# cipher_suites.py
+import os
+import json
+import time
+import platform
+import cryptography
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+
+# Authenticated ciphers new files can be written with. The id is stored in
+# file headers, so ids must never be renumbered or reused. Every suite takes
+# a 32-byte key and a 12-byte nonce and appends a 16-byte tag.
+SUITE_AES_256_GCM = 1
+SUITE_CHACHA20_POLY1305 = 2
+
+SUITES = {
+    SUITE_AES_256_GCM: ("AES-256-GCM", AESGCM),
+    SUITE_CHACHA20_POLY1305: ("ChaCha20-Poly1305", ChaCha20Poly1305),
+}
+
+# The benchmark result is kept per host and library version, so a home
+# directory shared between machines or an OpenSSL upgrade triggers a rerun.
+CACHE_PATH = os.environ.get("FILEENC_SUITE_CACHE") or os.path.join(
+    os.path.expanduser("~"), ".cache", "fileenc", "cipher_suites.json")
+
+_preferred = None
+
+
+def suite_name(suite):
+    return SUITES[suite][0] if suite in SUITES else f"unknown suite {suite}"
+
+def suite_by_name(name):
+    for suite, (suite_label, _) in SUITES.items():
+        if suite_label.lower() == name.lower():
+            return suite
+    raise ValueError(f"Unknown cipher suite {name!r}")
+
+def aead(suite, key):
+    if suite not in SUITES:
+        raise ValueError(f"Unknown cipher suite {suite}")
+    return SUITES[suite][1](key)
+
+def benchmark(block_size=256 * 1024, min_time=0.05, repeats=3):
+    # Returns {suite: MB/s} for sealing block_size blocks; the best of a few
+    # short runs, so a busy moment does not decide the outcome.
+    data = os.urandom(block_size)
+    nonce = os.urandom(12)
+    results = {}
+    for suite in SUITES:
+        cipher = aead(suite, os.urandom(32))
+        cipher.encrypt(nonce, data, None)
+        best = 0.0
+        for _ in range(repeats):
+            count = 0
+            start = time.perf_counter()
+            while True:
+                cipher.encrypt(nonce, data, None)
+                count += 1
+                elapsed = time.perf_counter() - start
+                if elapsed >= min_time:
+                    break
+            best = max(best, count * block_size / (1024 * 1024) / elapsed)
+        results[suite] = best
+    return results
+
+def _host_id():
+    return " ".join([platform.node(), platform.machine(), platform.processor() or "-",
+                     default_backend().openssl_version_text(), "cryptography", cryptography.__version__])
+
+def _load_cache():
+    try:
+        with open(CACHE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(cache):
+    # A read-only home directory only costs a benchmark per process.
+    try:
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        tmp_path = f"{CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, CACHE_PATH)
+    except OSError:
+        pass
+
+def preferred_suite(refresh=False):
+    # The suite new encryptions use: FILEENC_SUITE if set, otherwise the
+    # fastest one on this host, measured once and remembered on disk.
+    global _preferred
+    forced = os.environ.get("FILEENC_SUITE")
+    if forced:
+        return suite_by_name(forced)
+    if _preferred is not None and not refresh:
+        return _preferred
+
+    host = _host_id()
+    cache = _load_cache()
+    entry = cache.get(host)
+    if refresh or not isinstance(entry, dict) or entry.get("suite") not in SUITES:
+        results = benchmark()
+        entry = {"suite": max(results, key=results.get),
+                 "mb_per_s": {suite_name(suite): round(speed, 1) for suite, speed in results.items()},
+                 "measured": int(time.time())}
+        cache[host] = entry
+        _save_cache(cache)
+    _preferred = entry["suite"]
+    return _preferred
+
+def cached_results():
+    return _load_cache().get(_host_id())
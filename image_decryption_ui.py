@@ -1,7 +1,7 @@
 from PyQt5.QtWidgets import (
     QWidget, QLabel, QPushButton, QFileDialog, QMessageBox,
-    QVBoxLayout, QHBoxLayout, QFrame, QSpacerItem, QSizePolicy,
-    QComboBox, QInputDialog, QLineEdit, QRadioButton
+    QVBoxLayout, QFrame, QSpacerItem, QSizePolicy,
+    QComboBox, QInputDialog, QLineEdit
 )
 from PyQt5.QtGui import QIcon, QFont, QColor, QPainter, QMovie, QPixmap
 from PyQt5.QtCore import Qt, QSize
@@ -9,7 +9,6 @@ import image
 
 decrypted_output_path = None
 encrypted_image_path = None
-current_algorithm = "AES"  # Default algorithm
 
 def select_encrypted_image_for_decryption(label):
     global encrypted_image_path
@@ -23,7 +22,7 @@ def select_encrypted_image_for_decryption(label):
         label.setText(f"📁 {encrypted_image_path.split('/')[-1]}")
 
 def decrypt_image_ui(parent=None):
-    global encrypted_image_path, current_algorithm
+    global encrypted_image_path
     
     if not encrypted_image_path:
         QMessageBox.warning(parent, "Error", "Please select an encrypted image file.")
@@ -42,19 +41,14 @@ def decrypt_image_ui(parent=None):
         None, 
         "Save Decrypted Image As", 
         "", 
-        "PNG Files (*.png)"
+        "PNG Files (*.png);;All Files (*)"
     )
     if not output_path:
         return
     
     try:
-        success = False
-        if current_algorithm == "AES":
-            success = image.decrypt_image_aes(encrypted_image_path, output_path, password)
-        elif current_algorithm == "ChaCha20":
-            success = image.decrypt_image_chacha20(encrypted_image_path, output_path, password)
-        elif current_algorithm == "Fernet":
-            success = image.decrypt_image_fernet(encrypted_image_path, output_path, password)
+        # The algorithm and key derivation are read from the file itself.
+        success = image.decrypt_image(encrypted_image_path, output_path, password)
         
         if success:
             QMessageBox.information(
@@ -100,8 +94,6 @@ class GlassFrame(QFrame):
         super().paintEvent(event)
 
 def run_decryption_ui(parent_window=None):
-    global current_algorithm
-    
     window = QWidget()
     window.setWindowTitle("🔓 Image Decryption")
     window.setStyleSheet("""
@@ -168,25 +160,6 @@ def run_decryption_ui(parent_window=None):
     vbox = QVBoxLayout(card)
     vbox.setSpacing(20)
 
-    # Algorithm selection (Radio buttons)
-    aes_radio = QRadioButton("AES")
-    aes_radio.setChecked(current_algorithm == "AES")
-    aes_radio.toggled.connect(lambda: update_algorithm("AES"))
-    
-    chacha_radio = QRadioButton("ChaCha20")
-    chacha_radio.setChecked(current_algorithm == "ChaCha20")
-    chacha_radio.toggled.connect(lambda: update_algorithm("ChaCha20"))
-    
-    fernet_radio = QRadioButton("Fernet")
-    fernet_radio.setChecked(current_algorithm == "Fernet")
-    fernet_radio.toggled.connect(lambda: update_algorithm("Fernet"))
-    
-    radio_layout = QHBoxLayout()
-    radio_layout.addWidget(aes_radio)
-    radio_layout.addWidget(chacha_radio)
-    radio_layout.addWidget(fernet_radio)
-    vbox.addLayout(radio_layout)
-
     file_label = QLabel("📁 No encrypted image selected")
     select_btn = create_button(
         "Select Encrypted Image", 
@@ -248,9 +221,3 @@ def run_decryption_ui(parent_window=None):
 
     if parent_window:
         parent_window.hide()
-
-def update_algorithm(selected_algorithm):
-    global current_algorithm
-    current_algorithm = selected_algorithm
-    
-
@@ -10,7 +10,7 @@ from PyQt5.QtGui import QMovie
 
 encrypt_image_path = None
 image_path = None
-current_algorithm = "AES"  # Default algorithm
+current_algorithm = "Auto"  # Fastest AEAD, recorded in the file header
 
 def select_file(label, dialog_type='open', file_type='Images (*.png *.jpg *.jpeg)', is_save=False):
     global image_path, encrypt_image_path
@@ -42,7 +42,9 @@ def encrypt(parent=None):
         return
     
     try:
-        if current_algorithm == "AES":
+        if current_algorithm == "Auto":
+            image.encrypt_image(image_path, encrypt_image_path, password)
+        elif current_algorithm == "AES":
             image.encrypt_image_aes(image_path, encrypt_image_path, password)
         elif current_algorithm == "ChaCha20":
             image.encrypt_image_chacha20(image_path, encrypt_image_path, password)
@@ -81,17 +83,20 @@ def create_algorithm_selection():
     algo_frame = QFrame()
     algo_layout = QHBoxLayout()  # Change from QVBoxLayout to QHBoxLayout
 
+    auto_radio = QRadioButton("Auto")
     aes_radio = QRadioButton("AES")
     chacha_radio = QRadioButton("ChaCha20")
     fernet_radio = QRadioButton("Fernet")
     
-    aes_radio.setChecked(True)  # Default selection
+    auto_radio.setChecked(True)  # Default selection
 
+    auto_radio.toggled.connect(lambda: set_algorithm("Auto"))
     aes_radio.toggled.connect(lambda: set_algorithm("AES"))
     chacha_radio.toggled.connect(lambda: set_algorithm("ChaCha20"))
     fernet_radio.toggled.connect(lambda: set_algorithm("Fernet"))
     
     # Add radio buttons to the layout
+    algo_layout.addWidget(auto_radio)
     algo_layout.addWidget(aes_radio)
     algo_layout.addWidget(chacha_radio)
     algo_layout.addWidget(fernet_radio)
@@ -99,7 +104,7 @@ def create_algorithm_selection():
     algo_frame.setLayout(algo_layout)
     
     # Apply consistent background color for radio buttons
-    for radio_button in [aes_radio, chacha_radio, fernet_radio]:
+    for radio_button in [auto_radio, aes_radio, chacha_radio, fernet_radio]:
         radio_button.setStyleSheet("""
             QRadioButton {
                 background-color: #34495E;